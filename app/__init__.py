@@ -22,6 +22,26 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login_manager.init_app(app)
     login_manager.login_view = "main.login"
+
+    from app.replay_cache import replay_cache
+    replay_cache.init_app(app)
+    from app.ingest_jobs import ingest_queue
+    ingest_queue.init_app(app)
+    from app.response_cache import response_cache
+    response_cache.init_app(app)
+    from app.state_store import state_store
+    state_store.init_app(app)
+    from app.http_client import http_client
+    http_client.init_app(app)
+    from app.sprite_cache import sprite_cache
+    sprite_cache.init_app(app)
+    from app.match_analytics import match_history_cache
+    match_history_cache.init_app(app)
+
+    # registers the listener keeping per-user totals in step with deleted matches
+    from app import pokemon_stats
+    from app.commands import register_commands
+    register_commands(app)
     csrf = CSRFProtect(app)
 
     return app
@@ -0,0 +1,73 @@
+"""
+Building blocks shared by the caches and stores kept next to the main database.
+
+`LRUCache` is a thread-safe in-process LRU, the first level of the response and sprite
+caches. `SQLiteConnections` hands each thread its own connection to a SQLite file,
+creating the file and its schema on first use, for the stores shared between worker
+processes (`state_store`, `response_cache`, `sprite_cache`).
+
+Usage Example:
+
+    entries = LRUCache(max_entries=1000)
+    entries.put("Miraidon", sprite_url)
+    entries.get("Miraidon") # None once evicted
+
+    connections = SQLiteConnections("instance/cache.db", [
+        "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    ])
+    with connections.get() as conn:
+        conn.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, value))
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the value under `key`, marking it as recently used, or `default` if there is none."""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Stores `value` under `key`, evicting the least recently used entries if over the cap."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteConnections:
+    def __init__(self, path, schema=()):
+        """Connections to the SQLite file at `path`, which are set up by running
+        each statement in `schema` (e.g. CREATE TABLE IF NOT EXISTS) when opened.
+        """
+        self.path = path
+        self.schema = list(schema)
+        self._local = threading.local()
+
+    def get(self):
+        """Returns this thread's connection, opening it on first use."""
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            # readers don't block the writer, which matters with several worker processes
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,62 @@
+"""
+Maintenance commands, run with `flask <command>`.
+"""
+import json
+import time
+
+import click
+from flask.cli import with_appcontext
+
+from app import db
+from app.pokemon_stats import rebuild_pokemon_stats
+from app.reparse import reparse_matches
+from app.http_client import http_client
+from app.sprite_cache import SHOWDOWN_POKEDEX_URL, MANIFEST_PATH, build_sprite_manifest
+
+@click.command("rebuild-pokemon-stats")
+@click.option("--username", default=None, help="Only rebuild this user's totals.")
+@with_appcontext
+def rebuild_pokemon_stats_command(username):
+    """Recompute the per-user Pokémon totals from the stored matches."""
+    corrected = rebuild_pokemon_stats(db.session, username)
+    db.session.commit()
+    click.echo(f"Rebuilt Pokémon totals; {corrected} stored rows were out of date.")
+
+@click.command("build-sprite-manifest")
+@click.option("--pokedex", default=SHOWDOWN_POKEDEX_URL, show_default=True,
+              help="URL or path of Showdown's pokedex.json.")
+@click.option("--output", default=MANIFEST_PATH, show_default=True, type=click.Path(dir_okay=False))
+def build_sprite_manifest_command(pokedex, output):
+    """Build the species to sprite manifest used to look up sprites offline."""
+    if pokedex.startswith(("http://", "https://")):
+        response = http_client.get(pokedex)
+        response.raise_for_status()
+        data = response.json()
+    else:
+        with open(pokedex, encoding="utf-8") as f:
+            data = json.load(f)
+    manifest = build_sprite_manifest(data)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+        f.write("\n")
+    click.echo(f"Wrote the sprites of {len(manifest)} species to {output}.")
+
+@click.command("reparse-matches")
+@click.option("--workers", type=int, default=None, help="Number of parser processes (default: all cores).")
+@click.option("--batch-size", type=int, default=500, show_default=True, help="Matches rewritten per transaction.")
+@click.option("--offline", is_flag=True, help="Skip matches whose log isn't stored locally instead of downloading it.")
+@click.option("--username", default=None, help="Only reparse this user's matches.")
+@with_appcontext
+def reparse_matches_command(workers, batch_size, offline, username):
+    """Reparse the stored matches that were parsed by an older version of the parser."""
+    start = time.perf_counter()
+    result = reparse_matches(db.session, workers, batch_size, download=not offline, username=username)
+    click.echo(f"Reparsed {result.reparsed} matches in {time.perf_counter() - start:.1f}s; "
+               f"{result.missing} without a stored log, {len(result.failures)} failed.")
+    for replay_url, error in result.failures:
+        click.echo(f"  FAILED {replay_url}: {error}")
+
+def register_commands(app):
+    app.cli.add_command(rebuild_pokemon_stats_command)
+    app.cli.add_command(build_sprite_manifest_command)
+    app.cli.add_command(reparse_matches_command)
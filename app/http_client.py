@@ -0,0 +1,142 @@
+"""
+Shared client for outbound HTTP requests (Showdown replay logs, pokeapi sprites).
+
+Every request gets connect and read timeouts, and goes through one pooled keep-alive
+`requests.Session`. Connection errors and 5xx/429 responses are retried with exponential
+backoff. A URL that failed is remembered for `failure_ttl` seconds, and asking for it
+again within that time fails straight away. Each host also has a circuit breaker:
+after `breaker_threshold` failed requests in a row, further requests to that host fail
+fast with `CircuitOpenError` for `breaker_cooldown` seconds, then one trial request
+is let through to see if the host is back.
+
+Client errors like 404 aren't failures of the host, so they don't trip the breaker,
+but they are also remembered for `failure_ttl` seconds. At most `max_failures` URLs
+are remembered at once; expired ones are dropped as new failures come in.
+
+Usage Example:
+
+    response = http_client.get("https://replay.pokemonshowdown.com/gen9ou-1.log")
+    response.raise_for_status()
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to a host that is failing."""
+
+class HttpClient:
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.5,
+                 failure_ttl=60, breaker_threshold=5, breaker_cooldown=30, pool_size=16, max_failures=1024):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_ttl = failure_ttl
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.pool_size = pool_size
+        self.max_failures = max_failures
+        self._lock = threading.Lock()
+        self._session = None
+        # url -> (expires at, response or (exception type, message)), oldest first
+        self._failures = OrderedDict()
+        self._hosts = {}     # host -> [consecutive failures, open until]
+
+    def init_app(self, app):
+        self.connect_timeout = app.config.get("HTTP_CONNECT_TIMEOUT", self.connect_timeout)
+        self.read_timeout = app.config.get("HTTP_READ_TIMEOUT", self.read_timeout)
+        self.retries = app.config.get("HTTP_RETRIES", self.retries)
+        self.backoff = app.config.get("HTTP_BACKOFF", self.backoff)
+        self.failure_ttl = app.config.get("HTTP_FAILURE_TTL", self.failure_ttl)
+        self.breaker_threshold = app.config.get("HTTP_BREAKER_THRESHOLD", self.breaker_threshold)
+        self.breaker_cooldown = app.config.get("HTTP_BREAKER_COOLDOWN", self.breaker_cooldown)
+        self.reset()
+
+    def reset(self):
+        """Forgets remembered failures and open circuits, and starts a new session."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._failures.clear()
+            self._hosts.clear()
+
+    def get(self, url, **kwargs):
+        """Sends a GET request, returning the `requests.Response` like `requests.get`.
+        Raises a `requests.exceptions.RequestException` if no response was received,
+        or `CircuitOpenError` if the host's circuit is open.
+        """
+        host = urlsplit(url).netloc
+        now = time.time()
+        with self._lock:
+            failure = self._failures.get(url)
+            if failure is not None and failure[0] <= now:
+                del self._failures[url]
+                failure = None
+            state = self._hosts.get(host)
+            if failure is None and state is not None and state[1]:
+                if state[1] > now:
+                    raise CircuitOpenError(f"{host} is failing, not retrying for {state[1] - now:.0f}s")
+                # let one trial request through once the cooldown is over
+                state[1] = now + self.breaker_cooldown
+        if failure is not None:
+            if isinstance(failure[1], tuple):
+                # a new exception each time, rather than re-raising one with another request's traceback
+                error_type, message = failure[1]
+                raise error_type(message)
+            return failure[1]
+
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        try:
+            response = self._get_session().get(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self._record(url, host, (type(e), str(e)), host_failed=True)
+            raise
+        if response.status_code >= 400:
+            self._record(url, host, response, host_failed=response.status_code >= 500 or response.status_code == 429)
+        else:
+            with self._lock:
+                self._hosts.pop(host, None)
+        return response
+
+    def _record(self, url, host, failure, host_failed):
+        now = time.time()
+        with self._lock:
+            self._failures.pop(url, None)
+            self._failures[url] = (now + self.failure_ttl, failure)
+            # every entry lives as long, so the expired ones are all at the front
+            while self._failures:
+                oldest = next(iter(self._failures.values()))
+                if oldest[0] > now and len(self._failures) <= self.max_failures:
+                    break
+                self._failures.popitem(last=False)
+            if not host_failed:
+                self._hosts.pop(host, None)
+                return
+            state = self._hosts.setdefault(host, [0, 0])
+            state[0] += 1
+            if state[0] >= self.breaker_threshold:
+                state[1] = now + self.breaker_cooldown
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                retry = Retry(
+                    total=self.retries, backoff_factor=self.backoff,
+                    status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+                self._session = requests.Session()
+                self._session.mount("https://", adapter)
+                self._session.mount("http://", adapter)
+            return self._session
+
+# Create a global instance
+http_client = HttpClient()
@@ -0,0 +1,185 @@
+"""
+Background ingestion of uploaded replays.
+
+Uploading replays creates an `IngestJob`, which is put on a local queue and processed
+by a small pool of worker threads, so `/visualise` can return straight away instead
+of waiting for every replay to be downloaded, parsed and saved. The progress of
+each replay in a job can be polled through `IngestJob.to_dict()`.
+
+A job's progress is written to the shared `state_store` as it changes, so it can be
+polled from any worker process, not just the one that accepted the upload, and it
+expires along with the rest of the stored state. Setting `INGEST_WORKERS` to 0
+processes jobs inline instead.
+
+Usage Example:
+
+    job = ingest_queue.submit(current_user.username, replay_urls)
+    ingest_queue.get(job.id).to_dict()
+    # {"id": "...", "status": "running", "done": 3, "total": 10, "replays": [...]}
+"""
+import queue
+import threading
+import time
+import uuid
+
+from app import db
+from app.replay_cache import canonical_replay_id
+from app.replay_parser import parse_replays_concurrently, save_parsed_log_to_db, find_stored_replay_ids
+from app.state_store import state_store
+
+class IngestJob:
+    def __init__(self, username, urls):
+        self.id = uuid.uuid4().hex
+        self.username = username
+        self.status = "queued" # -> "running" -> "finished"
+        self.finished_at = None
+        # each replay's status goes "pending" -> "saved" | "skipped" | "failed"
+        self.replays = [{"url": url, "status": "pending", "message": None} for url in urls]
+
+    @staticmethod
+    def _state_id(job_id):
+        return f"ingest-job:{job_id}"
+
+    @classmethod
+    def load(cls, job_id):
+        """Returns the job with `job_id` as last saved, or None if it doesn't exist or has expired."""
+        state = state_store.get(cls._state_id(job_id), "job")
+        if state is None:
+            return None
+        job = cls.__new__(cls)
+        job.id = job_id
+        job.username = state["username"]
+        job.status = state["status"]
+        job.finished_at = state["finished_at"]
+        job.replays = state["replays"]
+        return job
+
+    def save(self):
+        """Writes the job's progress to the state store, where every process can see it."""
+        state_store.set(self._state_id(self.id), "job", {
+            "username": self.username,
+            "status": self.status,
+            "finished_at": self.finished_at,
+            "replays": self.replays,
+        })
+
+    @property
+    def finished(self):
+        return self.status == "finished"
+
+    def messages(self):
+        """Returns `(message, category)` for every replay that wasn't saved,
+        in the same wording the upload flow flashes them with.
+        """
+        categories = {"skipped": "info", "failed": "error"}
+        return [(r["message"], categories[r["status"]]) for r in self.replays if r["status"] in categories]
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "done": sum(r["status"] != "pending" for r in self.replays),
+            "saved": sum(r["status"] == "saved" for r in self.replays),
+            "total": len(self.replays),
+            "replays": [dict(r) for r in self.replays],
+        }
+
+    def _set_replay(self, index, status, message=None):
+        self.replays[index] = {"url": self.replays[index]["url"], "status": status, "message": message}
+        self.save()
+
+    def _finish(self):
+        self.finished_at = time.time()
+        self.status = "finished"
+        self.save()
+
+def run_ingest_job(job):
+    """Downloads, parses and saves every replay in `job`, recording each one's outcome.
+    Replays are fetched concurrently but saved in upload order. Needs an app context.
+    """
+    job.status = "running"
+    job.save()
+    replay_ids = [canonical_replay_id(replay["url"]) for replay in job.replays]
+    # one query for the whole upload, and repeats within it count as processed too
+    seen_ids = find_stored_replay_ids(replay_ids)
+    pending = []
+    for index, (replay, replay_id) in enumerate(zip(job.replays, replay_ids)):
+        if replay_id in seen_ids:
+            job._set_replay(index, "skipped", f"Replay {replay['url']} has already been processed.")
+            continue
+        seen_ids.add(replay_id)
+        pending.append(index)
+
+    results = parse_replays_concurrently(job.replays[i]["url"] for i in pending)
+    for index, (replay_url, parsed_log, error) in zip(pending, results):
+        if error is None:
+            try:
+                save_parsed_log_to_db(parsed_log, db, job.username)
+            except Exception as e:
+                db.session.rollback()
+                error = e
+        if error is None:
+            job._set_replay(index, "saved")
+        else:
+            job._set_replay(index, "failed", f"Failed to process replay {replay_url}: {str(error)}")
+
+    job._finish()
+
+class IngestJobQueue:
+    def __init__(self):
+        self.app = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get("INGEST_WORKERS", 2)
+
+    def submit(self, username, urls):
+        """Creates a job for `urls` and queues it; when there are no workers
+        configured the job is run before returning.
+        """
+        job = IngestJob(username, urls)
+        job.save()
+
+        if self.workers <= 0:
+            run_ingest_job(job)
+        else:
+            self._start_workers()
+            self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        """Returns the job with `job_id`, or None if it doesn't exist or has expired."""
+        return IngestJob.load(job_id)
+
+    def _start_workers(self):
+        # started on first use rather than in `init_app`, so forking servers
+        # don't end up with threads that only exist in the parent process
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"ingest-worker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                with self.app.app_context():
+                    try:
+                        run_ingest_job(job)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                # never let one broken job take the worker down with it
+                for index, replay in enumerate(job.replays):
+                    if replay["status"] == "pending":
+                        job._set_replay(index, "failed", f"Failed to process replay {replay['url']}: {str(e)}")
+                job._finish()
+            finally:
+                self._queue.task_done()
+
+# Create a global instance
+ingest_queue = IngestJobQueue()
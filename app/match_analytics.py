@@ -0,0 +1,211 @@
+"""
+Columnar analytics over a user's whole match history, with NumPy.
+
+`PokemonStats` keeps a user's running totals over every match they have, which is
+all the visualise page needs by default. To look at a slice of the history instead
+(a date range, one opponent, one format...), `MatchHistory` loads the user's matches,
+the Pokémon on their side of each and the moves those used into NumPy arrays, in
+three queries. Filters are then boolean masks over the matches, and the totals of
+every species over a mask are computed with vectorized group-bys (`np.bincount`),
+so any number of filters can be tried without going back to the database.
+
+Loaded histories are kept in `match_history_cache` under the user's data version,
+so they are reloaded only after the user's matches change.
+
+Usage Example:
+
+    history = match_history_cache.get(username)
+    recent = history.filter(since=datetime(2025, 1, 1), format="gen9vgc2025regg")
+    stats = history.pokemon_stats(recent & history.filter(opponent=["gary", "misty"]))
+    print(stats["Miraidon"]["wins"], stats["Miraidon"]["moves"])
+"""
+from datetime import timezone
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from app.caching import LRUCache
+from app.models import Match, Team, TeamPokemon, MoveUsage, Species, Move
+from app.response_cache import data_version
+
+# the most (species, move) pairs grouped into a bin each, rather than by sorting
+MAX_DENSE_GROUPS = 4 * 1024 * 1024
+
+def replay_format(replay_id):
+    """Returns the format a replay was played in, from its replay ID, e.g.
+    "gen9vgc2025regg-2212345678" (or a private "gen9ou-123-abcdef") -> "gen9vgc2025regg"
+    """
+    return replay_id.split("-", 1)[0] if replay_id else ""
+
+def _codes(values):
+    """Dictionary-encodes `values`, returning the distinct values and each one's index among them."""
+    distinct, codes = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+    return distinct.tolist(), codes
+
+def _utc_seconds(moment):
+    # dates are stored as naive UTC
+    if getattr(moment, "tzinfo", None) is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(moment, "s")
+
+def _wanted(values):
+    return [values] if isinstance(values, str) else list(values)
+
+class MatchHistory:
+    """A user's match history, one NumPy array per column.
+
+    Matches: `match_ids`, `played_at` (datetime64, NaT if unknown), `won`, and the
+    `opponent_codes` and `format_codes` indexing `opponents` and `formats`.
+    The Pokémon on the user's side of each match: `pokemon_match` (the index of their
+    match), `pokemon_species` (indexing `species_names`), `pokemon_wins` and `pokemon_defeated`.
+    The moves each of those used: `move_pokemon` (the index of the Pokémon),
+    `move_codes` (indexing `move_names`) and `move_times_used`.
+    """
+    def __init__(self, matches, pokemons, moves, species_names, move_names):
+        match_ids, played_at, opponents, winners, replay_ids = matches
+        self.match_ids = np.array(match_ids, dtype=np.int64)
+        self.played_at = np.array(played_at, dtype="datetime64[s]")
+        # opponents are matched like Showdown usernames, regardless of case
+        self.opponents, self.opponent_codes = _codes([(name or "").lower() for name in opponents])
+        self.formats, self.format_codes = _codes([replay_format(replay_id) for replay_id in replay_ids])
+        self.won = (np.array(winners, dtype=object) != np.array(opponents, dtype=object)).astype(bool)
+
+        pokemon_ids, pokemon_match_ids, species_ids, wins, defeated = pokemons
+        pokemon_ids = np.array(pokemon_ids, dtype=np.int64)
+        # matches and Pokémon are loaded in order of id, so rows are found by binary search
+        self.pokemon_match = np.searchsorted(self.match_ids, np.array(pokemon_match_ids, dtype=np.int64))
+        self.species_names = [species_names[species_id] for species_id in sorted(species_names)]
+        self.pokemon_species = np.searchsorted(np.array(sorted(species_names), dtype=np.int64), np.array(species_ids, dtype=np.int64))
+        self.pokemon_wins = np.array([w or 0 for w in wins], dtype=np.int64)
+        self.pokemon_defeated = np.array([bool(d) for d in defeated], dtype=bool)
+
+        move_pokemon_ids, move_ids, times_used = moves
+        self.move_pokemon = np.searchsorted(pokemon_ids, np.array(move_pokemon_ids, dtype=np.int64))
+        self.move_names = [move_names[move_id] for move_id in sorted(move_names)]
+        self.move_codes = np.searchsorted(np.array(sorted(move_names), dtype=np.int64), np.array(move_ids, dtype=np.int64))
+        self.move_times_used = np.array([t or 0 for t in times_used], dtype=np.int64)
+
+    @classmethod
+    def load(cls, session, username):
+        """Loads the match history of `username`."""
+        user_pokemon = (
+            select(TeamPokemon.id)
+            .join(Team, TeamPokemon.team_id == Team.id)
+            .join(Match, Team.match_id == Match.id)
+            .where(Match.user_id == username, Team.is_user_team.is_(True))
+        )
+        matches = session.execute(
+            select(Match.id, Match.played_at, Match.enemyname, Match.winner, Match.replay_id)
+            .where(Match.user_id == username).order_by(Match.id)
+        ).all()
+        pokemons = session.execute(
+            user_pokemon.add_columns(Team.match_id, TeamPokemon.species_id, TeamPokemon.wins, TeamPokemon.defeated)
+            .order_by(TeamPokemon.id)
+        ).all()
+        moves = session.execute(
+            select(MoveUsage.team_pokemon_id, MoveUsage.move_id, MoveUsage.times_used)
+            .where(MoveUsage.team_pokemon_id.in_(user_pokemon))
+        ).all()
+        species_names = dict(session.execute(
+            select(Species.id, Species.name).where(Species.id.in_({row.species_id for row in pokemons}))
+        ).all())
+        move_names = dict(session.execute(
+            select(Move.id, Move.name).where(Move.id.in_({row.move_id for row in moves}))
+        ).all())
+        return cls(_columns(matches, 5), _columns(pokemons, 5), _columns(moves, 3), species_names, move_names)
+
+    def filter(self, since=None, until=None, opponent=None, format=None):
+        """Returns a boolean mask over the matches, selecting those played from
+        `since` up to (but not including) `until`, against `opponent` and in `format`.
+        `opponent` and `format` can also be lists of them. Masks combine with & and |.
+        Matches whose date isn't known are left out of any date range.
+        """
+        mask = np.ones(len(self.match_ids), dtype=bool)
+        if since is not None:
+            mask &= self.played_at >= _utc_seconds(since)
+        if until is not None:
+            mask &= self.played_at < _utc_seconds(until)
+        if opponent is not None:
+            mask &= np.isin(self.opponent_codes, _indices(self.opponents, [name.lower() for name in _wanted(opponent)]))
+        if format is not None:
+            mask &= np.isin(self.format_codes, _indices(self.formats, _wanted(format)))
+        return mask
+
+    def pokemon_stats(self, matches=None, species=None):
+        """Returns the totals of each species over the `matches` selected by a mask
+        (see `filter`), or over every match, in the same form as `fetch_pokemon_data_for_usr`:
+        {species: {"moves": {move: times used}, "wins", "losses", "matches_won", "truename"}}
+        Only the species in `species` are returned, if it is given.
+        """
+        rows = np.ones(len(self.pokemon_match), dtype=bool) if matches is None else matches[self.pokemon_match]
+        codes = self.pokemon_species[rows]
+        n_species = len(self.species_names)
+        brought = np.bincount(codes, minlength=n_species)
+        wins = np.bincount(codes, weights=self.pokemon_wins[rows], minlength=n_species).astype(np.int64)
+        losses = np.bincount(codes, weights=self.pokemon_defeated[rows], minlength=n_species).astype(np.int64)
+        matches_won = np.bincount(codes, weights=self.won[self.pokemon_match[rows]], minlength=n_species).astype(np.int64)
+
+        selected = brought > 0
+        if species is not None:
+            wanted = np.zeros(n_species, dtype=bool)
+            wanted[_indices(self.species_names, species)] = True
+            selected &= wanted
+        result = {}
+        for code, w, l, mw in zip(np.flatnonzero(selected).tolist(), wins[selected].tolist(),
+                                  losses[selected].tolist(), matches_won[selected].tolist()):
+            name = self.species_names[code]
+            result[name] = {"moves": {}, "wins": w, "losses": l, "matches_won": mw, "truename": name}
+
+        # moves are grouped by (species, move), packed into one integer key
+        move_rows = rows[self.move_pokemon]
+        move_species = self.pokemon_species[self.move_pokemon[move_rows]]
+        keys = move_species * len(self.move_names) + self.move_codes[move_rows]
+        weights = self.move_times_used[move_rows]
+        if n_species * len(self.move_names) <= MAX_DENSE_GROUPS:
+            # a bin for every (species, move), much quicker than sorting the keys
+            times_used = np.bincount(keys, weights=weights, minlength=n_species * len(self.move_names))
+            keys = np.flatnonzero(times_used)
+            times_used = times_used[keys].astype(np.int64)
+        else:
+            keys, groups = np.unique(keys, return_inverse=True)
+            times_used = np.bincount(groups, weights=weights, minlength=len(keys)).astype(np.int64)
+        species_codes, move_codes = np.divmod(keys, max(len(self.move_names), 1))
+        keep = selected[species_codes]
+        for code, move_code, times in zip(species_codes[keep].tolist(), move_codes[keep].tolist(), times_used[keep].tolist()):
+            result[self.species_names[code]]["moves"][self.move_names[move_code]] = times
+        return result
+
+def _columns(rows, n):
+    """Turns query result rows into a list of `n` columns."""
+    return list(zip(*rows)) if rows else [()] * n
+
+def _indices(distinct, wanted):
+    """Returns the indices of the `wanted` values among the sorted `distinct` values, skipping missing ones."""
+    positions = {value: i for i, value in enumerate(distinct)}
+    return [positions[value] for value in wanted if value in positions]
+
+class MatchHistoryCache:
+    """An in-process LRU of loaded `MatchHistory`s, under each user's data version."""
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._entries = LRUCache(max_entries)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("MATCH_HISTORY_CACHE_SIZE", 16)
+        self._entries = LRUCache(self.max_entries)
+
+    def get(self, username):
+        """Returns the `MatchHistory` of `username` as it is now, loading it if needed."""
+        version = data_version(username)
+        if version is None:
+            raise Exception("User doesn't exist!")
+        key = (username, version)
+        history = self._entries.get(key)
+        if history is None:
+            history = MatchHistory.load(db.session, username)
+            self._entries.put(key, history)
+        return history
+
+# Create a global instance
+match_history_cache = MatchHistoryCache()
@@ -1,15 +1,26 @@
 from flask_login import UserMixin
 from flask import session
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite, postgresql
 from app import db  # Changed from 'config import db'
 
+# the databases whose INSERT supports ON CONFLICT DO NOTHING
+_insert_dialects = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
 class User(UserMixin, db.Model):
     __tablename__ = "user"
     username = db.Column(db.String, primary_key=True)
     email = db.Column(db.String, nullable=False, unique=True)
     showdown_username = db.Column(db.String, unique=True,) 
     password = db.Column(db.String, nullable=False)
+    # bumped whenever the user's matches change, so cached views of their data expire
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # kept up to date by `app.pokemon_stats` with the user's totals, so numbering the match history doesn't count it
+    match_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     matches = db.relationship("Match", back_populates="user", cascade="all, delete-orphan")  # Cascade delete
+    pokemon_stats = db.relationship("PokemonStats", cascade="all, delete-orphan")  # Cascade delete
+    pokemon_move_stats = db.relationship("PokemonMoveStats", cascade="all, delete-orphan")  # Cascade delete
     def set_password(self, password):
         self.password = generate_password_hash(password, method='pbkdf2:sha256')
 
@@ -26,49 +37,132 @@ class Match(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # Primary key
     winner = db.Column(db.String)
     replay_url = db.Column(db.String)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.username"), nullable=False)  # Foreign key to User
+    # canonical form of `replay_url` (see `canonical_replay_id`), so the same battle is only stored once
+    replay_id = db.Column(db.String, unique=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.username"), nullable=False, index=True)  # Foreign key to User
     user = db.relationship("User", back_populates="matches")  # Back reference to User
     enemyname = db.Column(db.String)
-    teams = db.relationship("Team", back_populates="match", cascade="all, delete-orphan")  # Cascade delete
+    teams = db.relationship("Team", back_populates="match", cascade="all, delete-orphan", order_by="Team.id")  # Cascade delete, user's team first
     p1_initial_elo = db.Column(db.Integer)
     p1_final_elo = db.Column(db.Integer)
     p2_initial_elo = db.Column(db.Integer)
     p2_final_elo = db.Column(db.Integer)
+    # when the battle started, from the log's first timestamp
+    played_at = db.Column(db.DateTime)
+    # `PARSER_VERSION` of the parser that produced the stored teams, NULL if from before versioning
+    parser_version = db.Column(db.Integer)
 
 
 class Team(db.Model):
     __tablename__ = "team"
     id = db.Column(db.Integer, primary_key=True)  # Primary key
-    match_id = db.Column(db.Integer, db.ForeignKey("match.id"), nullable=False)  # Foreign key to Match
+    match_id = db.Column(db.Integer, db.ForeignKey("match.id"), nullable=False, index=True)  # Foreign key to Match
     is_user_team = db.Column(db.Boolean, nullable=False)  # True = user's team, False = enemy's team
     match = db.relationship("Match", back_populates="teams")  # Back reference to Match
-    pokemons = db.relationship("TeamPokemon", back_populates="team", cascade="all, delete-orphan")  # Cascade delete
+    pokemons = db.relationship("TeamPokemon", back_populates="team", cascade="all, delete-orphan", order_by="TeamPokemon.id")  # Cascade delete
+
+
+class NameTable:
+    # Each species and move name is stored once, and the match tables refer to it by id,
+    # so their rows and indexes stay small and the analytics group on integers
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False, unique=True)
+
+    @classmethod
+    def lookup(cls, session, names):
+        """Returns {name: row} for each of `names`, adding the names that aren't stored yet."""
+        names = set(names)
+        rows = {row.name: row for row in session.scalars(select(cls).where(cls.name.in_(names)))} if names else {}
+        missing = names - rows.keys()
+        if missing:
+            # another transaction may be adding the same names
+            insert = _insert_dialects[session.get_bind().dialect.name]
+            session.execute(insert(cls.__table__).on_conflict_do_nothing(index_elements=["name"]), [{"name": name} for name in missing])
+            rows.update((row.name, row) for row in session.scalars(select(cls).where(cls.name.in_(missing))))
+        return rows
+
+
+class Species(NameTable, db.Model):
+    __tablename__ = "species"
+
+
+class Move(NameTable, db.Model):
+    __tablename__ = "move"
 
 
 class TeamPokemon(db.Model):
     __tablename__ = "team_pokemon"
     id = db.Column(db.Integer, primary_key=True)  # Primary key
-    team_id = db.Column(db.Integer, db.ForeignKey("team.id"), nullable=False)  # Foreign key to Team
-    pokemon_name = db.Column(db.String, nullable=False)  # Pokémon name
+    team_id = db.Column(db.Integer, db.ForeignKey("team.id"), nullable=False, index=True)  # Foreign key to Team
+    species_id = db.Column(db.Integer, db.ForeignKey("species.id"), nullable=False, index=True)  # Foreign key to Species
+    species = db.relationship("Species", lazy="joined", innerjoin=True)  # always loaded along with the Pokémon
     ispick = db.Column(db.Boolean)
     wins = db.Column(db.Integer)
     defeated = db.Column(db.Boolean)
-    nickname = db.Column(db.String)  # Optional nickname
+    nickname = db.Column(db.String)  # Optional nickname, NULL unless it differs from the species name
+    sprite_url = db.Column(db.String)  # Resolved when the replay is saved; NULL for older rows
     # position = db.Column(db.Integer)  # Optional position (e.g., 1-6)
     team = db.relationship("Team", back_populates="pokemons")  # Back reference to Team
     move_usages = db.relationship("MoveUsage", back_populates="team_pokemon", cascade="all, delete-orphan")  # Cascade delete
 
+    @property
+    def pokemon_name(self):
+        return self.species.name  # Pokémon name
+
 
 class MoveUsage(db.Model):
     __tablename__ = "move_usage"
     id = db.Column(db.Integer, primary_key=True)  # Primary key
-    team_pokemon_id = db.Column(db.Integer, db.ForeignKey("team_pokemon.id"), nullable=False)  # Foreign key to TeamPokemon
-    move_name = db.Column(db.String, nullable=False)  # Move name
+    team_pokemon_id = db.Column(db.Integer, db.ForeignKey("team_pokemon.id"), nullable=False, index=True)  # Foreign key to TeamPokemon
+    move_id = db.Column(db.Integer, db.ForeignKey("move.id"), nullable=False)  # Foreign key to Move
+    move = db.relationship("Move", lazy="joined", innerjoin=True)  # always loaded along with the usage
     times_used = db.Column(db.Integer, default=0)  # Number of times the move was used
     team_pokemon = db.relationship("TeamPokemon", back_populates="move_usages")  # Back reference to TeamPokemon
 
+    @property
+    def move_name(self):
+        return self.move.name  # Move name
+
 
 class SharedAccess(db.Model):
+    # a user's data can only be shared with each other user once; this also indexes lookups by owner
+    __table_args__ = (db.UniqueConstraint("owner_username", "shared_with_username", name="uq_shared_access_owner_shared_with"),)
     id = db.Column(db.Integer, primary_key=True)
     owner_username = db.Column(db.String, db.ForeignKey('user.username'), nullable=False)
-    shared_with_username = db.Column(db.String, db.ForeignKey('user.username'), nullable=False)
+    shared_with_username = db.Column(db.String, db.ForeignKey('user.username'), nullable=False, index=True)
+
+
+class PokemonStats(db.Model):
+    # running totals of each Pokémon on a user's own team, over all of their matches
+    # kept up to date by `app.pokemon_stats` whenever matches are saved or deleted
+    __tablename__ = "pokemon_stats"
+    username = db.Column(db.String, db.ForeignKey("user.username"), primary_key=True)
+    species_id = db.Column(db.Integer, db.ForeignKey("species.id"), primary_key=True)  # Foreign key to Species
+    species = db.relationship("Species", lazy="joined", innerjoin=True)
+    matches = db.Column(db.Integer, nullable=False, default=0)  # Number of matches the Pokémon was brought to
+    wins = db.Column(db.Integer, nullable=False, default=0)  # Pokémon defeated by this Pokémon
+    losses = db.Column(db.Integer, nullable=False, default=0)  # Times this Pokémon fainted
+    matches_won = db.Column(db.Integer, nullable=False, default=0)
+
+    @property
+    def pokemon_name(self):
+        return self.species.name
+
+
+class PokemonMoveStats(db.Model):
+    # running total of the times each Pokémon on a user's own team used each move
+    __tablename__ = "pokemon_move_stats"
+    username = db.Column(db.String, db.ForeignKey("user.username"), primary_key=True)
+    species_id = db.Column(db.Integer, db.ForeignKey("species.id"), primary_key=True)  # Foreign key to Species
+    move_id = db.Column(db.Integer, db.ForeignKey("move.id"), primary_key=True)  # Foreign key to Move
+    species = db.relationship("Species", lazy="joined", innerjoin=True)
+    move = db.relationship("Move", lazy="joined", innerjoin=True)
+    times_used = db.Column(db.Integer, nullable=False, default=0)
+
+    @property
+    def pokemon_name(self):
+        return self.species.name
+
+    @property
+    def move_name(self):
+        return self.move.name
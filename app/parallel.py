@@ -0,0 +1,60 @@
+"""
+Helpers for bulk parsing: running a function over a stream of tasks on a process
+pool, and saving the results in batches.
+
+Used by `batch_parse.py` and `flask reparse-matches`, which both parse thousands of
+replay logs across every core and save the results from the calling process.
+
+Usage Example:
+
+    for result in map_in_processes(parse_log_source, sources, workers=8):
+        ...  # results arrive as they complete, not in the order of `sources`
+
+    # batch is [(name, parsed_log)]; if saving it together fails, each log is saved alone
+    failures = save_batch(lambda pairs: save_parsed_logs_to_db([log for _, log in pairs], db, username),
+                          batch, db.session.rollback)
+"""
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+def map_in_processes(function, tasks, workers):
+    """Calls `function` on each of `tasks` on a pool of `workers` processes (or in
+    this process, for one worker), yielding the results as they complete. Only a few
+    tasks per worker are in flight at once, so a large input, or the results of one,
+    is never held in memory all at the same time. `function` must be picklable, i.e.
+    defined at the top level of a module.
+    """
+    if workers <= 1:
+        yield from map(function, tasks)
+        return
+    max_in_flight = workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        for task in tasks:
+            in_flight.add(executor.submit(function, task))
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in in_flight:
+            yield future.result()
+
+def save_batch(save, batch, rollback):
+    """Saves `batch`, a list of `(name, item)`, by calling `save` on it in one go. If
+    that fails, `rollback` is called and each item is saved on its own instead, so one
+    bad item doesn't lose the rest of the batch. Returns `(name, error)` for every item
+    that couldn't be saved, with errors as strings like the workers return them.
+    """
+    try:
+        save(batch)
+        return []
+    except Exception:
+        rollback()
+
+    failures = []
+    for name, item in batch:
+        try:
+            save([(name, item)])
+        except Exception as e:
+            rollback()
+            failures.append((name, f"{type(e).__name__}: {e}"))
+    return failures
@@ -0,0 +1,220 @@
+"""
+Per-user Pokémon totals, maintained incrementally.
+
+`PokemonStats` and `PokemonMoveStats` hold the totals shown in tables two and three
+of the visualise page for every Pokémon a user has brought to a match. Saving matches
+adds their contribution with `add_matches_to_stats`, and deleting a match (directly, or
+by removing it from `User.matches`) subtracts it again before the flush. So reading a
+user's totals is a primary key lookup, and saving a replay only touches that replay's rows.
+Deleting a user deletes their totals along with their matches. `User.match_count`,
+which numbers the match history, is kept up to date the same way.
+
+Both also bump the affected users' `data_version`, expiring cached views of their data.
+
+`rebuild_pokemon_stats` recomputes the totals from the match tables, and is exposed as
+`flask rebuild-pokemon-stats` for consistency checks.
+"""
+from collections import Counter
+
+from sqlalchemy import event, select, update, delete, func, case, inspect
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session
+
+from app.models import User, Match, Team, TeamPokemon, MoveUsage, PokemonStats, PokemonMoveStats
+from app.response_cache import bump_data_version
+
+STATS_COUNTERS = ("matches", "wins", "losses", "matches_won")
+MOVE_COUNTERS = ("times_used",)
+# the databases whose INSERT supports ON CONFLICT DO UPDATE, used to increment totals atomically
+_upsert_dialects = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def match_contribution(matches):
+    """Returns what `matches` add to their users' totals, as lists of
+    `PokemonStats` and `PokemonMoveStats` column dicts.
+    """
+    stats, moves = {}, {}
+    for match in matches:
+        won = int(match.winner != match.enemyname)
+        for team in match.teams:
+            if not team.is_user_team: continue
+            for pokemon in team.pokemons:
+                key = (match.user_id, pokemon.species_id)
+                row = stats.setdefault(key, dict(username=key[0], species_id=key[1], matches=0, wins=0, losses=0, matches_won=0))
+                row["matches"] += 1
+                row["wins"] += pokemon.wins or 0
+                row["losses"] += int(bool(pokemon.defeated))
+                row["matches_won"] += won
+                for mu in pokemon.move_usages:
+                    move_key = key + (mu.move_id,)
+                    move_row = moves.setdefault(move_key, dict(username=key[0], species_id=key[1], move_id=mu.move_id, times_used=0))
+                    move_row["times_used"] += mu.times_used or 0
+    return list(stats.values()), list(moves.values())
+
+def add_matches_to_stats(session, matches):
+    """Adds the contribution of newly saved `matches` to their users' totals."""
+    add_contribution(session, *match_contribution(matches))
+    _count_matches(session, matches, 1)
+
+def remove_matches_from_stats(session, matches):
+    """Subtracts the contribution of `matches` from their users' totals,
+    dropping the rows of Pokémon that no longer appear in any match.
+    """
+    subtract_contribution(session, *match_contribution(matches))
+    _count_matches(session, matches, -1)
+    bump_data_version(session, {match.user_id for match in matches})
+
+def stored_contribution(session, match_ids):
+    """Returns what the stored matches with `match_ids` add to their users' totals, like 
+    `match_contribution`, but read straight from the match tables with GROUP BY.
+    """
+    stats_rows = [
+        dict(zip(("username", "species_id") + STATS_COUNTERS, row))
+        for row in session.execute(aggregate_stats_query(match_ids=match_ids))
+    ]
+    move_rows = [
+        dict(zip(("username", "species_id", "move_id") + MOVE_COUNTERS, row))
+        for row in session.execute(aggregate_move_stats_query(match_ids=match_ids))
+    ]
+    return stats_rows, move_rows
+
+def add_contribution(session, stats_rows, move_rows):
+    """Adds a contribution (see `match_contribution`) to the totals."""
+    _increment(session, PokemonStats, stats_rows, STATS_COUNTERS)
+    _increment(session, PokemonMoveStats, move_rows, MOVE_COUNTERS)
+
+def subtract_contribution(session, stats_rows, move_rows):
+    """Subtracts a contribution (see `match_contribution`) from the totals,
+    dropping the rows of Pokémon that no longer appear in any match.
+    """
+    for row in stats_rows:
+        for counter in STATS_COUNTERS: row[counter] = -row[counter]
+    for row in move_rows:
+        row["times_used"] = -row["times_used"]
+    add_contribution(session, stats_rows, move_rows)
+
+    usernames = {row["username"] for row in stats_rows}
+    if usernames:
+        session.execute(delete(PokemonStats).where(PokemonStats.username.in_(usernames), PokemonStats.matches <= 0))
+        session.execute(delete(PokemonMoveStats).where(PokemonMoveStats.username.in_(usernames), PokemonMoveStats.times_used <= 0))
+
+def _count_matches(session, matches, sign):
+    for username, count in Counter(match.user_id for match in matches).items():
+        session.execute(update(User).where(User.username == username).values(match_count=User.match_count + sign * count))
+
+def _increment(session, model, rows, counters):
+    """Adds each row's counters onto the existing row with the same primary key,
+    inserting it if there is none, in a single statement.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    stmt = _upsert_dialects[session.get_bind().dialect.name](table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.name for c in table.primary_key],
+        set_={c: table.c[c] + stmt.excluded[c] for c in counters}
+    )
+    session.execute(stmt, rows)
+
+def aggregate_stats_query(username=None, match_ids=None):
+    """Selects every user's totals straight from the match tables, with GROUP BY.
+    Pass `match_ids` to only count those matches.
+    """
+    won = case((Match.winner.is_distinct_from(Match.enemyname), 1), else_=0)
+    query = (
+        select(
+            Match.user_id, TeamPokemon.species_id,
+            func.count(TeamPokemon.id),
+            func.coalesce(func.sum(TeamPokemon.wins), 0),
+            func.sum(case((TeamPokemon.defeated.is_(True), 1), else_=0)),
+            func.sum(won),
+        )
+        .select_from(TeamPokemon)
+        .join(Team, TeamPokemon.team_id == Team.id)
+        .join(Match, Team.match_id == Match.id)
+        .where(Team.is_user_team.is_(True))
+        .group_by(Match.user_id, TeamPokemon.species_id)
+    )
+    if match_ids is not None:
+        query = query.where(Match.id.in_(match_ids))
+    return query if username is None else query.where(Match.user_id == username)
+
+def aggregate_move_stats_query(username=None, match_ids=None):
+    """Selects every user's move totals straight from the match tables, with GROUP BY."""
+    query = (
+        select(Match.user_id, TeamPokemon.species_id, MoveUsage.move_id, func.sum(MoveUsage.times_used))
+        .select_from(TeamPokemon)
+        .join(Team, TeamPokemon.team_id == Team.id)
+        .join(Match, Team.match_id == Match.id)
+        .join(MoveUsage, MoveUsage.team_pokemon_id == TeamPokemon.id)
+        .where(Team.is_user_team.is_(True))
+        .group_by(Match.user_id, TeamPokemon.species_id, MoveUsage.move_id)
+    )
+    if match_ids is not None:
+        query = query.where(Match.id.in_(match_ids))
+    return query if username is None else query.where(Match.user_id == username)
+
+def rebuild_pokemon_stats(session, username=None):
+    """Recomputes the totals and match counts of `username` (or of every user) from the
+    match tables, replacing the stored ones. Returns the number of stored rows that were wrong.
+    """
+    def stored(model, counters):
+        query = select(model)
+        if username is not None:
+            query = query.where(model.username == username)
+        pk = [c.name for c in model.__table__.primary_key]
+        return {tuple(getattr(r, c) for c in pk): tuple(getattr(r, c) for c in counters) for r in session.scalars(query)}
+
+    fresh_stats = {(row[0], row[1]): tuple(row[2:]) for row in session.execute(aggregate_stats_query(username))}
+    fresh_moves = {(row[0], row[1], row[2]): (row[3],) for row in session.execute(aggregate_move_stats_query(username))}
+    old_stats = stored(PokemonStats, STATS_COUNTERS)
+    old_moves = stored(PokemonMoveStats, MOVE_COUNTERS)
+    corrected = sum(
+        old.get(key) != fresh.get(key)
+        for old, fresh in ((old_stats, fresh_stats), (old_moves, fresh_moves))
+        for key in old.keys() | fresh.keys()
+    )
+
+    for model in (PokemonStats, PokemonMoveStats):
+        query = delete(model)
+        if username is not None:
+            query = query.where(model.username == username)
+        session.execute(query)
+    if fresh_stats:
+        session.execute(PokemonStats.__table__.insert(), [
+            dict(zip(("username", "species_id") + STATS_COUNTERS, key + values)) for key, values in fresh_stats.items()
+        ])
+    if fresh_moves:
+        session.execute(PokemonMoveStats.__table__.insert(), [
+            dict(zip(("username", "species_id", "move_id") + MOVE_COUNTERS, key + values)) for key, values in fresh_moves.items()
+        ])
+
+    # and the match counts, one per user
+    users = select(User.username, User.match_count)
+    counts = select(Match.user_id, func.count()).group_by(Match.user_id)
+    if username is not None:
+        users, counts = users.where(User.username == username), counts.where(Match.user_id == username)
+    counts = dict(session.execute(counts).all())
+    miscounted = {name for name, count in session.execute(users) if count != counts.get(name, 0)}
+    for name in miscounted:
+        session.execute(update(User).where(User.username == name).values(match_count=counts.get(name, 0)))
+    corrected += len(miscounted)
+
+    if corrected:
+        # cached views were built from the wrong totals
+        bump_data_version(session, miscounted | {key[0] for key in old_stats.keys() | fresh_stats.keys() | old_moves.keys() | fresh_moves.keys()})
+    return corrected
+
+@event.listens_for(Session, "before_flush")
+def _subtract_deleted_matches(session, flush_context, instances):
+    """Keeps the totals in step with matches deleted in this flush."""
+    removed = [obj for obj in session.deleted if isinstance(obj, Match)]
+    # matches taken out of `User.matches` are deleted as orphans during the flush
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            removed.extend(inspect(obj).attrs.matches.history.deleted)
+    # a deleted user's totals are deleted along with them
+    deleted_users = {obj.username for obj in session.deleted if isinstance(obj, User)}
+    removed = [m for m in dict.fromkeys(removed) if inspect(m).has_identity and m.user_id not in deleted_users]
+    if removed:
+        with session.no_autoflush:
+            remove_matches_from_stats(session, removed)
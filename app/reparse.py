@@ -0,0 +1,147 @@
+"""
+Reparses stored matches whose teams were produced by an older version of the parser.
+
+Each `Match` is stamped with the `PARSER_VERSION` that parsed it. Matches from an older
+version (or from before versioning) are reparsed from their raw log, read from the
+replay log cache where it's there and downloaded otherwise. Logs are parsed across
+every core with a process pool, and the results are written back in batched
+transactions: each batch's Team/TeamPokemon/MoveUsage rows are replaced with bulk
+statements, and the Pokémon totals are moved from the old rows over to the new ones.
+
+Exposed as `flask reparse-matches`.
+
+Usage Example:
+
+    result = reparse_matches(db.session, workers=8, batch_size=500)
+    print(result.reparsed, result.missing, result.failures)
+"""
+import os
+from dataclasses import dataclass, field
+
+from sqlalchemy import select, insert, update, delete, or_
+
+from app.models import Match, Team, TeamPokemon, MoveUsage
+from app.replay_parser import ReplayLogParser, PARSER_VERSION, match_columns, team_columns, resolve_lookups
+from app.replay_cache import replay_cache, canonical_replay_id
+from app.pokemon_stats import stored_contribution, add_contribution, subtract_contribution
+from app.response_cache import bump_data_version
+from app.parallel import map_in_processes, save_batch
+
+@dataclass
+class ReparseResult:
+    reparsed: int = 0
+    missing: int = 0 # no stored log, and it wasn't downloaded
+    failures: list = field(default_factory=list) # (replay URL, error)
+
+def outdated_matches_query(username=None):
+    """Selects the id and replay URL of every match parsed by an older parser."""
+    query = (
+        select(Match.id, Match.replay_url)
+        .where(or_(Match.parser_version.is_(None), Match.parser_version < PARSER_VERSION))
+        .where(Match.replay_url.is_not(None))
+        .order_by(Match.id)
+    )
+    return query if username is None else query.where(Match.user_id == username)
+
+def reparse_log(task):
+    """Worker entry point. Reparses the log of `(match_id, replay_url, download)`,
+    returning `(match_id, parsed_log, error)`. `parsed_log` and `error` are both None
+    if the log isn't stored and `download` is False. Errors are returned as strings,
+    as not every exception can be pickled back to the parent.
+    """
+    match_id, replay_url, download = task
+    try:
+        data = replay_cache.get(canonical_replay_id(replay_url))
+        if data is not None:
+            return match_id, ReplayLogParser.from_bytes(data, replay_url), None
+        if not download:
+            return match_id, None, None
+        # downloaded logs are added to the cache as they are parsed
+        return match_id, ReplayLogParser(replay_url), None
+    except Exception as e:
+        return match_id, None, f"{type(e).__name__}: {e}"
+
+def save_reparsed_batch(session, batch):
+    """Rewrites the matches in `batch`, {match id: parsed log}, and moves their 
+    contribution to the Pokémon totals over, in one transaction. Rows are deleted and 
+    inserted with bulk statements rather than through the ORM's unit of work, which 
+    would otherwise take up most of the time of a large reparse.
+    """
+    match_ids = list(batch)
+    # sprites may be looked up over the network, so this is done before the first 
+    # write, rather than while holding the database's write lock
+    lookups = resolve_lookups(session, batch.values())
+    old_contribution = stored_contribution(session, match_ids)
+    usernames = set(session.scalars(select(Match.user_id).where(Match.id.in_(match_ids))))
+
+    # no objects of these are loaded, so there is nothing in the session to synchronise
+    team_ids = select(Team.id).where(Team.match_id.in_(match_ids))
+    pokemon_ids = select(TeamPokemon.id).where(TeamPokemon.team_id.in_(team_ids))
+    for statement in (
+        delete(MoveUsage).where(MoveUsage.team_pokemon_id.in_(pokemon_ids)),
+        delete(TeamPokemon).where(TeamPokemon.team_id.in_(team_ids)),
+        delete(Team).where(Team.match_id.in_(match_ids)),
+    ):
+        session.execute(statement.execution_options(synchronize_session=False))
+
+    session.execute(update(Match), [dict(id=match_id, **match_columns(parsed_log)) for match_id, parsed_log in batch.items()])
+    teams = [
+        (match_id, is_user_team, pokemons)
+        for match_id, parsed_log in batch.items()
+        for is_user_team, pokemons in team_columns(parsed_log, lookups)
+    ]
+    # ids come back in the order the rows were given, and the user's team is inserted first
+    new_team_ids = session.scalars(
+        insert(Team).returning(Team.id, sort_by_parameter_order=True),
+        [dict(match_id=match_id, is_user_team=is_user_team) for match_id, is_user_team, _ in teams]
+    ).all()
+    pokemon_rows, move_usages = [], []
+    for team_id, (_, _, pokemons) in zip(new_team_ids, teams):
+        for pokemon, moves in pokemons:
+            pokemon_rows.append(dict(pokemon, team_id=team_id))
+            move_usages.append(moves)
+    new_pokemon_ids = session.scalars(
+        insert(TeamPokemon).returning(TeamPokemon.id, sort_by_parameter_order=True), pokemon_rows
+    ).all() if pokemon_rows else []
+    move_rows = [
+        dict(move_usage, team_pokemon_id=pokemon_id)
+        for pokemon_id, moves in zip(new_pokemon_ids, move_usages) for move_usage in moves
+    ]
+    if move_rows:
+        session.execute(insert(MoveUsage), move_rows)
+
+    add_contribution(session, *stored_contribution(session, match_ids))
+    subtract_contribution(session, *old_contribution)
+    bump_data_version(session, usernames)
+    session.commit()
+
+def reparse_matches(session, workers=None, batch_size=500, download=True, username=None):
+    """Reparses every match (of `username`, or of every user) stored by an older parser.
+    Logs that aren't stored locally are downloaded, unless `download` is False.
+    Returns a `ReparseResult`.
+    """
+    outdated = session.execute(outdated_matches_query(username)).all()
+    session.commit() # don't hold a read transaction open while parsing
+    result = ReparseResult()
+    urls = dict(outdated)
+    tasks = ((match_id, replay_url, download) for match_id, replay_url in outdated)
+
+    batch = {}
+    def flush_batch():
+        failures = save_batch(lambda pairs: save_reparsed_batch(session, dict(pairs)), list(batch.items()), session.rollback)
+        result.reparsed += len(batch) - len(failures)
+        result.failures.extend((urls[match_id], error) for match_id, error in failures)
+        batch.clear()
+
+    for match_id, parsed_log, error in map_in_processes(reparse_log, tasks, workers or os.cpu_count() or 1):
+        if error is not None:
+            result.failures.append((urls[match_id], error))
+        elif parsed_log is None:
+            result.missing += 1
+        else:
+            batch[match_id] = parsed_log
+            if len(batch) >= batch_size:
+                flush_batch()
+    if batch:
+        flush_batch()
+    return result
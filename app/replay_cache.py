@@ -0,0 +1,127 @@
+"""
+On-disk cache of raw Pokémon Showdown replay logs.
+
+Replays never change once saved, so each `.log` only ever has to be downloaded once.
+Logs are stored zlib-compressed, one file per replay, under a path derived from the
+SHA-256 of the replay's canonical ID. The cache is capped at `max_bytes`; reading a
+log refreshes its modification time, and the least recently used logs are evicted first.
+The global `replay_cache` is pointed at `REPLAY_CACHE_DIR` by `init_app`; until then,
+or if that is None, nothing is cached.
+
+Usage Example:
+
+    replay_id = canonical_replay_id('https://replay.pokemonshowdown.com/gen9ou-123.log?p2')
+    data = replay_cache.get(replay_id) # None on a miss
+    replay_cache.put(replay_id, data)
+"""
+import hashlib
+import os
+import tempfile
+import zlib
+from urllib.parse import urlsplit
+
+def canonical_replay_id(url):
+    """Reduces any form of a replay's URL (or battle room name) to its replay ID, e.g.
+    "https://replay.pokemonshowdown.com/gen9ou-123.log?p2" -> "gen9ou-123"
+    "battle-gen9ou-123" -> "gen9ou-123"
+    """
+    path = urlsplit(url.strip()).path
+    replay_id = path.rstrip('/').rsplit('/', 1)[-1].lower()
+    for suffix in (".log", ".json"):
+        replay_id = replay_id.removesuffix(suffix)
+    return replay_id.removeprefix("battle-")
+
+class ReplayLogCache:
+    # once over the cap, evict down to this fraction of it so eviction isn't run on every put
+    _low_watermark = 0.9
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory # None caches nothing
+        self.max_bytes = max_bytes
+        self._size = None # total bytes on disk, computed lazily
+
+    def init_app(self, app):
+        self.directory = app.config.get("REPLAY_CACHE_DIR")
+        self.max_bytes = app.config.get("REPLAY_CACHE_MAX_BYTES", self.max_bytes)
+        self._size = None
+
+    def path_for(self, replay_id):
+        """Returns the file a replay's log is stored in, fanned out over 256 directories."""
+        digest = hashlib.sha256(replay_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.log.z")
+
+    def get(self, replay_id):
+        """Returns the raw log stored for `replay_id`, or None if it isn't cached."""
+        if self.directory is None:
+            return None
+        path = self.path_for(replay_id)
+        try:
+            with open(path, "rb") as f:
+                data = zlib.decompress(f.read())
+        except (FileNotFoundError, zlib.error):
+            return None
+        try:
+            os.utime(path) # marks the log as recently used
+        except OSError:
+            pass
+        return data
+
+    def put(self, replay_id, data):
+        """Stores the raw log `data` for `replay_id`, evicting old logs if over the cap."""
+        if self.directory is None:
+            return
+        path = self.path_for(replay_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data)
+        # write to a temporary file first, so other processes never read half a log
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(compressed)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(tmp_path, path)
+
+        if self._size is None:
+            self._size = self._disk_usage()
+        else:
+            self._size += len(compressed) - replaced
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used logs until the cache is back under its cap."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self._low_watermark
+        for _, size, path in sorted(entries):
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def _disk_usage(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    pass
+        return total
+
+# Create a global instance
+replay_cache = ReplayLogCache(None, 512 * 1024 * 1024)
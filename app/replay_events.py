@@ -0,0 +1,208 @@
+"""
+Typed events read from a Pokémon Showdown replay log.
+
+A log is a list of "|kind|field|field..." lines. Each event type here reads one kind
+of line into a small typed event, and knows the prefix its lines start with, so
+`ReplayLogParser` can skip every other line (damage, timers, chat...) on a prefix
+check, without splitting or decoding it. The events are handed to the parser's
+consumers (see `ReplayConsumer`), and only the kinds some consumer asked for cost anything.
+
+Usage Example:
+
+    class MovePrinter(ReplayConsumer):
+        def on_move(self, event):
+            match event:
+                case MoveEvent(side=side, nickname=nickname, move=move):
+                    print(f"{side}'s {nickname} used {move}")
+
+    ReplayLogParser.from_file('tests/test_replay.log', consumers=[MovePrinter()])
+
+    # the lines to look at for turns and faints, and their event types by name
+    types = event_types(["turn", "faint"])
+    types.byte_prefixes, types.by_name["turn"]
+
+Adding an event type is a matter of adding a class with a `kind`, the `prefix` of
+its lines and a `from_fields` that reads it, and listing it in `EVENT_TYPES`.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import ClassVar
+
+@dataclass(slots=True)
+class PlayerEvent:
+    """|player|p1|ash ketchup|avatar|rating"""
+    kind: ClassVar[str] = "player"
+    prefix: ClassVar[str] = "|player|"
+    side: str
+    name: str
+
+    @classmethod
+    def from_fields(cls, fields):
+        if len(fields) < 4:
+            return None  # e.g. "|player|p1|" when a player leaves
+        return cls(fields[2], fields[3])
+
+@dataclass(slots=True)
+class PokeEvent:
+    """|poke|p1|Pikachu, F, shiny|item - a member of a team, before the battle starts"""
+    kind: ClassVar[str] = "poke"
+    prefix: ClassVar[str] = "|poke|"
+    side: str
+    species: str
+
+    @classmethod
+    def from_fields(cls, fields):
+        # ignores irrelevant details about pokemon's name
+        # e.g. "Pikachu, F, shiny" - we only want "Pikachu"
+        return cls(fields[2], fields[3].split(',')[0].strip())
+
+@dataclass(slots=True)
+class StartEvent:
+    """|start - the end of team preview"""
+    kind: ClassVar[str] = "start"
+    prefix: ClassVar[str] = "|start"
+
+    @classmethod
+    def from_fields(cls, fields):
+        return cls()
+
+@dataclass(slots=True)
+class TimestampEvent:
+    """|t:|1745000000 - the time, in seconds since the epoch, at the start of each turn"""
+    kind: ClassVar[str] = "timestamp"
+    prefix: ClassVar[str] = "|t:|"
+    seconds: int
+
+    @classmethod
+    def from_fields(cls, fields):
+        return cls(int(fields[2]))
+
+@dataclass(slots=True)
+class TurnEvent:
+    """|turn|12"""
+    kind: ClassVar[str] = "turn"
+    prefix: ClassVar[str] = "|turn|"
+    number: int
+
+    @classmethod
+    def from_fields(cls, fields):
+        return cls(int(fields[2]))
+
+@dataclass(slots=True)
+class SwitchEvent:
+    """|switch|p1b: Nickname|Calyrex-Shadow, L50|100/100"""
+    kind: ClassVar[str] = "switch"
+    prefix: ClassVar[str] = "|switch|"
+    side: str
+    slot: str
+    nickname: str
+    species: str
+
+    @classmethod
+    def from_fields(cls, fields):
+        # Converts "p1b: Calyrex" into [p1b, Calyrex]
+        slot, nickname = fields[2].split(": ")
+        return cls(slot[:2], slot, nickname, fields[3].split(',')[0])
+
+@dataclass(slots=True)
+class MoveEvent:
+    """|move|p1a: Nickname|Astral Barrage|p2a: Target"""
+    kind: ClassVar[str] = "move"
+    prefix: ClassVar[str] = "|move|"
+    side: str
+    nickname: str
+    move: str
+    target: str
+
+    @classmethod
+    def from_fields(cls, fields):
+        slot, nickname = fields[2].split(": ")
+        return cls(slot[:2], nickname, fields[3], fields[4] if len(fields) > 4 else "")
+
+@dataclass(slots=True)
+class TerastallizeEvent:
+    """|-terastallize|p1a: Nickname|Fairy"""
+    kind: ClassVar[str] = "terastallize"
+    prefix: ClassVar[str] = "|-terastallize|"
+    side: str
+    nickname: str
+    tera_type: str
+
+    @classmethod
+    def from_fields(cls, fields):
+        slot, nickname = fields[2].split(": ")
+        return cls(slot[:2], nickname, fields[3])
+
+@dataclass(slots=True)
+class FaintEvent:
+    """|faint|p2a: Nickname"""
+    kind: ClassVar[str] = "faint"
+    prefix: ClassVar[str] = "|faint|"
+    side: str
+    nickname: str
+
+    @classmethod
+    def from_fields(cls, fields):
+        slot, nickname = fields[2].split(": ")
+        return cls(slot[:2], nickname)
+
+@dataclass(slots=True)
+class WinEvent:
+    """|win|ash ketchup"""
+    kind: ClassVar[str] = "win"
+    prefix: ClassVar[str] = "|win|"
+    winner: str
+
+    @classmethod
+    def from_fields(cls, fields):
+        return cls(fields[2])
+
+@dataclass(slots=True)
+class RatingEvent:
+    """|raw|ash ketchup's rating: 1500 &rarr; <strong>1520</strong><br />(+20 for winning)
+    Ratings are given in the same order as the players, after the winner.
+    """
+    kind: ClassVar[str] = "rating"
+    prefix: ClassVar[str] = "|raw|"
+    before: str
+    after: str
+
+    @classmethod
+    def from_fields(cls, fields):
+        text = fields[2]
+        start = text.find(" rating: ")
+        if start == -1:
+            return None  # any other raw HTML
+        start += 9 # index of the current elo
+        before = text[start:text.find(" ", start)]
+        start = text.find("<strong>") + 8
+        after = text[start:text.find("</strong>", start)]
+        return cls(before, after)
+
+# every event type, by kind
+EVENT_TYPES = {event_type.kind: event_type for event_type in (
+    PlayerEvent, PokeEvent, StartEvent, TimestampEvent, TurnEvent, SwitchEvent, MoveEvent,
+    TerastallizeEvent, FaintEvent, WinEvent, RatingEvent,
+)}
+
+class EventTypes:
+    """The event types to read from a log, with the line prefixes they need checked
+    (as `bytes`, which the log is read as), and a lookup from a line's kind to its type.
+    """
+    __slots__ = ("by_name", "byte_prefixes")
+
+    def __init__(self, types):
+        # events are looked up by the name at the start of the line, e.g. "raw" for ratings
+        self.by_name = {t.prefix.strip('|'): t for t in types}
+        self.byte_prefixes = tuple(t.prefix.encode() for t in types)
+
+def event_types(kinds=None):
+    """Returns the `EventTypes` for the given kinds of event, or all of them."""
+    return _event_types(None if kinds is None else frozenset(kinds))
+
+@lru_cache(maxsize=64)
+def _event_types(kinds):
+    # parsers share the same few sets of event types, rather than each building its own
+    if kinds is None:
+        return EventTypes(EVENT_TYPES.values())
+    return EventTypes([t for kind, t in EVENT_TYPES.items() if kind in kinds])
@@ -24,20 +24,76 @@ Usage Example:
     # return the winning team
     print("Winner:", replay.winner)
 
+Logs that are already available locally can be parsed without any network access:
+
+    replay = ReplayLogParser.from_file('tests/test_replay.log')
+    replay = ReplayLogParser.from_bytes(raw_log_bytes, URL)
+    replay = ReplayLogParser.from_lines(iter_of_lines, URL)
+
+The log can also be pushed into a parser as it arrives, in chunks that can end
+anywhere, e.g. from a battle that is still being streamed:
+
+    replay = ReplayLogParser.incremental(URL)
+    for chunk in recorded_feed:
+        replay.feed(chunk)
+    replay.close()
+
+The log is read as a stream of typed events (see `app.replay_events`), which is 
+handed in one pass to a set of consumers, each working out part of the result: 
+`TeamBuilder`, `MoveCounter`, `FaintTracker` and `ResultTracker`. Anything else 
+to work out from a replay can be added as another consumer, without another pass:
+
+    class TurnCounter(ReplayConsumer):
+        turns = 0
+        def on_turn(self, event):
+            self.turns = event.number
+
+    turns = TurnCounter()
+    replay = ReplayLogParser.from_file('tests/test_replay.log', consumers=[turns])
+    print("Turns:", turns.turns)
+
 This assumes pokemon will not have empty names or names containing the char '|'.
 """
-import requests
+import os
+from sys import intern
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from app.models import *
 from dataclasses import dataclass, field
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from app.sprite_cache import sprite_cache
-@dataclass
+from app.http_client import http_client
+from app.replay_cache import replay_cache, canonical_replay_id
+from app.replay_events import EVENT_TYPES, event_types
+from app.pokemon_stats import add_matches_to_stats
+from app.match_analytics import match_history_cache
+from app.response_cache import bump_data_version
+
+# number of replays downloaded at once when ingesting a batch of URLs
+DEFAULT_FETCH_WORKERS = 8
+# used to rebuild a replay's URL from the name of a locally stored log
+REPLAY_BASE_URL = "https://replay.pokemonshowdown.com"
+# bytes read at a time while a replay log downloads
+REPLAY_CHUNK_SIZE = 16 * 1024
+# matches per page of a user's match history
+MATCH_PAGE_SIZE = 50
+# Stored with each match. Bump it whenever a change to the parser alters what is stored
+# for a replay, so that `flask reparse-matches` finds the matches parsed by older versions
+PARSER_VERSION = 2
+
+# Parsed replays are slotted, and every name in them is interned, so the thousands
+# of replays held while batch parsing share one copy of each species, nickname
+# and move name instead of a new string per replay
+
+@dataclass(slots=True)
 class Pokemon:
     name: str = ""
     moves: dict = field(default_factory=dict)
     wins: int = 0
     defeated:bool = False
 
-@dataclass
+@dataclass(slots=True)
 class Player:
     name: str = ""
     # stores a dictionary containing a player's pokemon
@@ -47,292 +103,571 @@ class Player:
     picks: set = field(default_factory=set) 
     elo: list = field(default_factory=list)
 
+class ReplayConsumer:
+    """Works something out from the events of a replay (see `app.replay_events`), 
+    during the parser's one pass over the log. Subclasses define an `on_<kind>` 
+    method for each kind of event they want, e.g. `on_move(event)`; lines of kinds
+    no consumer wants are skipped by a prefix check, and never tokenized. A consumer 
+    that is done with a kind of event can `unsubscribe` from it, so that once no 
+    consumer wants them, the rest of those lines are skipped too.
+    `self.parser` is the parser the consumer is bound to. Its `players` are kept up 
+    to date by the built-in consumers, which see each event before any added ones.
+    """
+    parser = None
+
+    def bind(self, parser):
+        self.parser = parser
+
+    def kinds(self):
+        """Returns the kinds of event this consumer handles."""
+        return [kind for kind in EVENT_TYPES if hasattr(self, f"on_{kind}")]
+
+    def unsubscribe(self, *kinds):
+        """Stops handing this consumer events of `kinds` for the rest of the log."""
+        for kind in kinds:
+            self.parser.unsubscribe(kind, getattr(self, f"on_{kind}"))
+
+class TeamBuilder(ReplayConsumer):
+    """Fills in the name, team and picks of each player. Pokemon are re-keyed by 
+    their nickname when they first switch in, so the consumers after this one 
+    can find them by the name the rest of the log uses.
+    """
+    def on_player(self, event):
+        # e.g. players['p2'].name = "ash ketchup"
+        self.parser.players[event.side].name = intern(event.name)
+
+    def on_poke(self, event):
+        pokemon_name = intern(event.species)
+        if pokemon_name:  # Ensure the name is not empty or None - no funny business
+            team = self.parser.players[event.side].team
+            team.setdefault(pokemon_name, Pokemon())
+            team[pokemon_name].name = pokemon_name
+
+    def on_start(self, event):
+        # players and teams are only read before the battle starts
+        self.unsubscribe("player", "poke", "start")
+
+    def on_switch(self, event):
+        # For some god forsaken reason, the log refers to the pokemon 
+        # almost exclusively by their nickname. Despite this, the initial list
+        # of pokemon fails to include their nicknames. Terrific. 
+        # If you're curious, just add ".log" to the end of a replay, and look at all 
+        # the "poke" fields
+        nickname = intern(event.nickname)
+        pokemon_name = event.species
+        player = self.parser.players[event.side]
+        t = player.team # e.g. players["p1"].team
+        if nickname not in t:
+            # Replace the key with the nickname instead
+            # The pokemon is already added to team by `on_poke`, so never fails
+            # (without a nickname, this is only reached by the forms below)
+            if pokemon_name not in t:
+                # we have an interesting case like Urshifu-Single-Strike vs Urshifu-Rapid-Strike
+                # or like deoxys
+                for p in t.keys():
+                    if p.endswith("-*") and pokemon_name.startswith(p[:-2]): 
+                        pokemon_name = p
+                        break
+
+            pokemon_name = intern(pokemon_name)
+            temp = Pokemon()
+            temp.name = pokemon_name
+            temp.moves = t[pokemon_name].moves.copy()
+            temp.wins = t[pokemon_name].wins
+            t.pop(pokemon_name)
+            t[nickname] = temp
+            t[nickname].name = pokemon_name # the actual name of the pokemon
+        # adds the pokemon to the 'picks' set of e.g. players['p1']
+        player.picks.add(nickname)
+
+class MoveCounter(ReplayConsumer):
+    """Counts the number of times each pokemon used each of its moves."""
+    def on_move(self, event):
+        moves = self.parser.players[event.side].team[event.nickname].moves
+        move = event.move
+        times_used = moves.get(move)
+        if times_used is None:
+            moves[intern(move)] = 1
+        else:
+            moves[move] = times_used + 1
+
+class FaintTracker(ReplayConsumer):
+    """Marks fainted pokemon as defeated, and credits the win to the opposing 
+    pokemon that attacked most recently.
+    """
+    def __init__(self):
+        # stores the most recent attacker for each team
+        # used to track which pokemon are responsible for fainting others
+        self.last_attacker = {"p1": "", "p2": ""}
+
+    def on_move(self, event):
+        self.last_attacker[event.side] = event.nickname
+
+    def on_faint(self, event):
+        players = self.parser.players
+        # set this pokemon's defeated field to True
+        players[event.side].team[event.nickname].defeated = True
+        enemy = "p2" if event.side == "p1" else "p1"
+        # increment the number of wins for the attacking pokemon
+        players[enemy].team[self.last_attacker[enemy]].wins += 1
+
+class ResultTracker(ReplayConsumer):
+    """Records when the battle started, the winner, and each player's rating 
+    before and after the match."""
+    def __init__(self):
+        self.ratings_seen = 0
+
+    def on_timestamp(self, event):
+        # the log is timestamped at the start of the battle and again every turn
+        self.parser.started_at = event.seconds
+        self.unsubscribe("timestamp")
+
+    def on_win(self, event):
+        self.parser.winner = event.winner
+
+    def on_rating(self, event):
+        # ratings come after the win, one per player, in order
+        if self.parser.winner is not None:
+            self.ratings_seen += 1
+            self.parser.players[f"p{self.ratings_seen}"].elo = [event.before, event.after]
+            if self.ratings_seen == 2:
+                self.unsubscribe("rating")
+
 class ReplayLogParser:
-    def __init__(self, URL):
+    # the consumers every parser starts with, in the order each event is handed to them
+    consumer_types = (TeamBuilder, MoveCounter, FaintTracker, ResultTracker)
+
+    def __init__(self, URL, session=None, lines=None, cache=replay_cache, consumers=()):
+        """Parses the replay at `URL`, fetching `{URL}.log` unless the log's 
+        `lines` are supplied (see `from_lines`, `from_bytes` and `from_file`).
+        Fetched logs are read from and saved to `cache`; pass None to skip it.
+        Any extra `consumers` (see `ReplayConsumer`) are fed the same pass over the log.
+        """
+        self._start(URL, consumers)
+
+        if lines is None:
+            # the log is parsed chunk by chunk while it downloads
+            for chunk in iter_replay_log_chunks(URL, session, cache):
+                self.feed(chunk)
+        else:
+            self.parse_lines(line.encode('utf-8') if isinstance(line, str) else line for line in lines)
+        self.close()
+
+    def _start(self, URL, consumers=()):
         self.players = {"p1": Player(), "p2": Player()}  
         self.winner = None # to be updated after win condition is satisfied
-        # this stuff is handled once main loop terminates
-        # stores the most recent attacker for each team
-        # used to track which pokemon are responsible for fainting others
-        self.last_attacker = ["", ""] 
-        #TODO
-        # handle terastallize
-        self.terastallize = {'p1': False, 'p2': False}
+        self.started_at = None # seconds since the epoch, if the log is timestamped
         # mostly to be returned to intermediary database-communicating class
         self.replay_url = URL
-
-        response = requests.get(f"{URL}.log")
-        response.raise_for_status()
-
-        # constructs an iterator, so we can divide the loop into several 
-        # functions that operate over specific areas, without having to keep track
-        # of where we're up 
-        self.log = (line.decode('utf-8') for line in response.iter_lines()) 
-
-        # Populates instance variables by operating over the log file
-        # by dividing states of the game into different helper functions.
-        self.parse_loop()
-
-    def parse_loop(self):
-        """ Main parsing loop. 
-        Counts the number of moves made and pokemon defeated by each pokemon, 
-        the names and ELO of each player, and the winner of the match, 
-        and stores this data in relevant fields such as `self.players`, 
-        `self.winner` etc. 
+        self._buffer = b"" # an incomplete line at the end of the last chunk fed
+
+        # each kind of event is handed to the consumers of that kind, in order
+        self._handlers = {}
+        for consumer in [consumer_type() for consumer_type in self.consumer_types] + list(consumers):
+            consumer.bind(self)
+            for kind in consumer.kinds():
+                self._handlers.setdefault(kind, []).append(getattr(consumer, f"on_{kind}"))
+        self._route_lines()
+
+    def _route_lines(self):
+        # only lines of the kinds someone handles are read from the log: their name
+        # (e.g. "move" in "|move|...") leads straight to the event type and its handlers
+        types = event_types(self._handlers)
+        self._prefixes = types.byte_prefixes
+        self._routes = {name: (t.from_fields, self._handlers[t.kind]) for name, t in types.by_name.items()}
+
+    def unsubscribe(self, kind, handler):
+        """Stops handing events of `kind` to `handler` (see `ReplayConsumer.unsubscribe`)."""
+        # the handlers are replaced rather than changed, as they may be being called
+        handlers = [h for h in self._handlers.get(kind, ()) if h != handler]
+        if handlers:
+            self._handlers[kind] = handlers
+        else:
+            self._handlers.pop(kind, None)
+        self._route_lines()
+
+    @classmethod
+    def incremental(cls, URL=None, consumers=()):
+        """Returns a parser that the log is pushed into as it arrives, with `feed` 
+        and `close`, e.g. from a battle that is still being streamed or a recorded feed.
+        `players` and `winner` are kept up to date as each line is parsed.
+        """
+        parser = cls.__new__(cls)
+        parser._start(URL, consumers)
+        return parser
+
+    @classmethod
+    def from_lines(cls, lines, URL=None, consumers=()):
+        """Parses a log supplied as any iterable of lines (`str` or `bytes`), 
+        such as an open file or the body of a response fetched elsewhere.
         """
-        # stores active pokemon for each player, using their nicknames as keys
-
-        # Initialize players before the game starts
-        self.parsePlayerData() # we are now at "|start|..."
-
-        for line in self.log:
-            line = line.split('|')
-            if len(line) < 2: continue
-            if line[1] == 'win': break
-            match line[1]: 
-                case 'switch':
-                    # For some god forsaken reason, the log refers to the pokemon 
-                    # almost exclusively by their nickname. Despite this, the initial list
-                    # of pokemon fails to include their nicknames. Terrific. 
-                    # If you're curious, just add ".log" to the end of a replay, and look at all 
-                    # the "poke" fields
-
-                    # Converts "|switch|p1b: Calyrex|..." into [p1b, Calyrex]
-                    active_p_num, nickname = line[2].split(": ")
-                    pokemon_name = line[3].split(',')[0]
-                    t = self.players[active_p_num[:2]].team # e.g. players["p1"].team
-                    if nickname not in t and nickname != pokemon_name:
-                        # Replace the key with the nickname instead
-                        # The pokemon is already added to team in `getPlayerData`, so never fails
-                        if pokemon_name not in t:
-                            # we have an interesting case like Urshifu-Single-Strike vs Urshifu-Rapid-Strike
-                            # or like deoxys
-                            for p in t.keys():
-                                if p.endswith("-*") and pokemon_name.startswith(p[:-2]): 
-                                    pokemon_name = p
-                                    break
-                                    
-                        temp = Pokemon()
-                        temp.name = pokemon_name
-                        temp.moves = t[pokemon_name].moves.copy()
-                        temp.wins = t[pokemon_name].wins
-                        t.pop(pokemon_name)
-                        t[nickname] = temp
-                        t[nickname].name = pokemon_name # the actual name of the pokemon
-                    # adds the pokemon to the 'picks' set of e.g. players['p1']
-                    self.players[active_p_num[:2]].picks.add(nickname)
-
-                case 'move':
-                    active_p_num, nickname = line[2].split(": ")
-                    # active_p_num looks like `p1a`, p_num looks like "1"
-                    p_num = int(active_p_num[1])
-                    # updates the most recent attacking pokemon for the team
-                    self.last_attacker[p_num - 1] = nickname # index starts at 0
-                    move_name = line[3]
-                    pokemon = self.players[f"p{p_num}"].team[nickname]
-                    pokemon.moves[move_name] = pokemon.moves.get(move_name, 0) + 1
-
-                case 'faint':
-                    active_p_num, nickname = line[2].split(": ")
-                    # set this pokemon's defeated field to True
-                    self.players[active_p_num[:2]].team[nickname].defeated = True
-                    enemy_index = int(active_p_num[1]) % 2 # p1a -> 1, p2a -> 0
-                    attacker_pokemon = self.last_attacker[enemy_index] 
-                    # increment the number of wins for the attacking pokemon
-                    self.players[f"p{enemy_index + 1}"].team[attacker_pokemon].wins += 1
-                    
-
-        if line[1] != "win":
+        return cls(URL, lines=lines, consumers=consumers)
+
+    @classmethod
+    def from_bytes(cls, data, URL=None, consumers=()):
+        """Parses a log supplied as the raw bytes of a `.log` file."""
+        parser = cls.incremental(URL, consumers)
+        parser.feed(data)
+        return parser.close()
+
+    @classmethod
+    def from_file(cls, path, URL=None, consumers=()):
+        """Parses a `.log` file stored on disk. If no `URL` is given, it is 
+        rebuilt from the file name, e.g. "gen9ou-123.log" -> ".../gen9ou-123"
+        """
+        if URL is None:
+            URL = replay_url_for_file(path)
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read(), URL, consumers)
+
+    def feed(self, data):
+        """Parses the next chunk of the log. Chunks can end anywhere, even within 
+        a line: the rest of the line is parsed once the next chunk completes it.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        self.parse_lines(lines)
+
+    def close(self):
+        """Parses whatever is left of the log once it has all been fed, and checks 
+        that the battle finished. Returns the parser.
+        """
+        self.parse_lines([self._buffer])
+        self._buffer = b""
+        # the consumers are done with, and parsed replays are often held in bulk
+        self._handlers = self._routes = self._prefixes = None
+        if self.winner is None:
             # We've run out of lines early. Dodgy log
             raise Exception("Replay terminates before win state is met. Please supply a valid replay.")
-        else:
-            self.winner = line[2]
-            self.handleGameEnd()
-    
-    def parsePlayerData(self):
-        """Retrieves initial pokemon data from `log`.
-        Fetches the username of the players and the team of each player, 
-        and initialises `self.players['pn'].name` and `self.players['pn'].team`
-        """
-        for line in self.log:
-            line = line.split('|') 
-            match line[1]:
-                case 'start':
-                    break
-                case 'player':
-                    # e.g. players['p2'].name = "ash ketchup"
-                    self.players[line[2]].name = line[3]
-                case 'poke':
-                    # ignores irrelevant details about pokemon's name
-                    # e.g. "Pikachu, F, shiny" - we only want "Pikachu"
-                    pokemon_name = line[3].split(',')[0].strip()  
-                    if pokemon_name:  # Ensure the name is not empty or None - no funny business
-                        self.players[line[2]].team.setdefault(pokemon_name, Pokemon())
-                        self.players[line[2]].team[pokemon_name].name = pokemon_name
-
-    def handleGameEnd(self):
-        """Handles log content after the 'win' statement is encountered.
-        Parses the log and locates the current and new ELO for each player, 
-        and updates relevant `self.player.elo` field
+        return self
+
+    def parse_lines(self, lines):
+        """Parses complete lines of the log, as `bytes`. Most lines are of no interest 
+        to any consumer, and are skipped by a prefix check without being decoded or 
+        split; an event is only built for a line some consumer will read.
         """
-        i = 1
-        for line in self.log:
-            if line.startswith("|raw"): # so we don't look for " rating " a million times
-                if " rating: " in line: # we have an elo updating line
-                    line = line.split('|')
-                    # finding and setting the current elo
-                    temp = line[2].find(" rating: ") + 9 # index of the current elo
-                    cur_elo_end_index = line[2].find(" ", temp)
-                    cur_elo = line[2][temp:cur_elo_end_index]
-
-                    temp = line[2].find("<strong>") + 8
-                    new_elo_end_index = line[2].find("</strong>", temp)
-                    new_elo = line[2][temp:new_elo_end_index]
-                    self.players[f"p{i}"].elo = [cur_elo, new_elo]
-                    i+=1
-
-def save_parsed_log_to_db(parsed_log, db, username):
-    players = parsed_log.players
+        prefixes, routes = self._prefixes, self._routes
+        for line in lines:
+            if not line.startswith(prefixes):
+                continue
+            fields = line.decode('utf-8').rstrip('\r\n').split('|')
+            route = routes.get(fields[1])
+            if route is None:
+                continue  # only shares a prefix, e.g. "|startsomething"
+            event = route[0](fields)
+            if event is not None:
+                handlers = route[1]
+                for handler in handlers:
+                    handler(event)
+                # a consumer may have unsubscribed
+                prefixes, routes = self._prefixes, self._routes
+
+def replay_url_for_file(path):
+    """Rebuilds a replay's URL from the name of its `.log` file,
+    e.g. "logs/gen9ou-123.log" -> "https://replay.pokemonshowdown.com/gen9ou-123"
+    """
+    return f"{REPLAY_BASE_URL}/{os.path.splitext(os.path.basename(path))[0]}"
+
+def iter_replay_log_chunks(URL, session=None, cache=replay_cache, chunk_size=REPLAY_CHUNK_SIZE):
+    """Yields the raw bytes of `{URL}.log` in chunks as they are downloaded, 
+    or in one chunk from `cache` if it's there. Once the whole log has been 
+    downloaded it is added to the cache.
+    """
+    replay_id = canonical_replay_id(URL)
+    if cache is not None:
+        data = cache.get(replay_id)
+        if data is not None:
+            yield data
+            return
+
+    # the shared client applies timeouts and retries, and lets concurrent fetches reuse pooled connections
+    http = session or http_client
+    response = http.get(f"{URL}.log", stream=True)
+    with response:
+        response.raise_for_status()
+        chunks = []
+        for chunk in response.iter_content(chunk_size):
+            chunks.append(chunk)
+            yield chunk
+    if cache is not None:
+        cache.put(replay_id, b"".join(chunks))
+
+def parse_replays_concurrently(urls, max_workers=DEFAULT_FETCH_WORKERS, session=None):
+    """Downloads and parses several replays at once on a bounded thread pool.
+    Yields `(url, parsed_log, error)` tuples in the same order as `urls`, as soon 
+    as each one (and every one before it) is ready. Exactly one of `parsed_log` 
+    and `error` is None, so callers can persist successes and report failures per URL.
+    -urls: the replay URLs to fetch, without the ".log" suffix
+    -max_workers: the maximum number of replays downloaded at the same time
+    -session: an optional `requests.Session` to use instead of the shared `http_client`
+    """
+    urls = list(urls)
+    if not urls:
+        return
+    workers = max(1, min(max_workers, len(urls)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(ReplayLogParser, url, session) for url in urls]
+        for url, future in zip(urls, futures):
+            try:
+                yield url, future.result(), None
+            except Exception as e:
+                yield url, None, e
+
+@dataclass
+class ReplayLookups:
+    """What a batch of parsed logs needs looked up before it is stored, by name: 
+    the sprite URL and `Species` row of each Pokémon, and the `Move` row of each move.
+    """
+    sprite_urls: dict
+    species: dict
+    moves: dict
+
+def resolve_lookups(session, parsed_logs):
+    """Returns the `ReplayLookups` of a batch of parsed logs, adding any species
+    and moves that haven't been stored before.
+    """
+    species = set().union(*(pokemon_names(parsed_log) for parsed_log in parsed_logs))
+    moves = set().union(*(move_names(parsed_log) for parsed_log in parsed_logs))
+    return ReplayLookups(
+        sprite_urls=sprite_cache.get_sprite_urls(species),
+        species=Species.lookup(session, species),
+        moves=Move.lookup(session, moves),
+    )
+
+def build_match(parsed_log, username, lookups=None):
+    """Builds the `Match` for a parsed log, with its teams, Pokémon and move usages 
+    attached through their relationships, so the whole replay can be inserted in 
+    one flush without committing to obtain primary keys along the way.
+    -lookups: the `ReplayLookups` already resolved for a batch of logs
+    """
+    if lookups is None:
+        lookups = resolve_lookups(db.session, [parsed_log])
+    species = {row.id: row for row in lookups.species.values()}
+    moves = {row.id: row for row in lookups.moves.values()}
     match = Match(
         user_id=username, # showdown name FK - links match to user
+        replay_url=parsed_log.replay_url,
+        replay_id=canonical_replay_id(parsed_log.replay_url) if parsed_log.replay_url else None,
+        **match_columns(parsed_log)
+    )
+
+    # Add teams for the match, with their Pokémon and the moves each Pokémon used
+    for is_user_team, pokemons in team_columns(parsed_log, lookups):
+        match.teams.append(Team(is_user_team=is_user_team, pokemons=[
+            TeamPokemon(**pokemon, species=species[pokemon["species_id"]], move_usages=[
+                MoveUsage(**move_usage, move=moves[move_usage["move_id"]]) for move_usage in move_usages
+            ])
+            for pokemon, move_usages in pokemons
+        ]))
+    return match
+
+def match_columns(parsed_log):
+    """Returns the `Match` columns that are parsed from its log: the result,
+    when it was played, the ELO of each player and the version of the parser.
+    """
+    players = parsed_log.players
+    columns = dict(
         # to store half as much data (when the opposing player submits their matches), have enemyname be another FK
         enemyname=players['p2'].name,
-        teams=[],  # Teams will be added later
-        winner=parsed_log.winner, 
-        replay_url=parsed_log.replay_url
+        winner=parsed_log.winner,
+        # stored as naive UTC, like every other date in SQLite
+        played_at=datetime.fromtimestamp(parsed_log.started_at, timezone.utc).replace(tzinfo=None)
+            if parsed_log.started_at is not None else None,
+        parser_version=PARSER_VERSION,
     )
+    # ELO data
+    for player_key, player in players.items():
+        # don't add elo to db if game is not competitive
+        initial_elo, final_elo = player.elo if len(player.elo) == 2 else (None, None)
+        columns[f"{player_key}_initial_elo"] = initial_elo
+        columns[f"{player_key}_final_elo"] = final_elo
+    return columns
+
+def team_columns(parsed_log, lookups):
+    """Returns `(is_user_team, pokemons)` for both teams of a parsed log, where
+    `pokemons` lists the `TeamPokemon` columns of each Pokémon along with the
+    `MoveUsage` columns of each move it used.
+    """
+    teams = []
+    for team_key, player in parsed_log.players.items():
+        pokemons = []
+        for nickname, pokemon_data in player.team.items():
+            pokemons.append((dict(
+                # most Pokémon go by their species name, which is already stored in `Species`
+                nickname=nickname if nickname != pokemon_data.name else None,
+                species_id=lookups.species[pokemon_data.name].id,
+                sprite_url=lookups.sprite_urls[pokemon_data.name],
+                ispick=nickname in player.picks,
+                wins=pokemon_data.wins,
+                defeated=pokemon_data.defeated,
+            ), [
+                dict(move_id=lookups.moves[move_name].id, times_used=times_used)
+                for move_name, times_used in pokemon_data.moves.items()
+            ]))
+        teams.append((team_key == 'p1', pokemons))
+    return teams
+
+def pokemon_names(parsed_log):
+    """Returns the species names of every Pokémon in a parsed log."""
+    return {pokemon.name for player in parsed_log.players.values() for pokemon in player.team.values()}
+
+def move_names(parsed_log):
+    """Returns the names of every move used in a parsed log."""
+    return {move for player in parsed_log.players.values() for pokemon in player.team.values() for move in pokemon.moves}
+
+def save_parsed_log_to_db(parsed_log, db, username, commit=True):
+    """Saves a parsed log under `username` in a single transaction. 
+    Pass `commit=False` to leave the match pending in the caller's transaction.
+    """
+    match = build_match(parsed_log, username)
     db.session.add(match)
-    db.session.commit()
-
-    # Add teams for the match
-    for team_key in parsed_log.players.keys():
-        team = Team(
-            match_id=match.id,
-            is_user_team=(team_key == 'p1')
-        )
-        db.session.add(team)
+    add_matches_to_stats(db.session, [match])
+    bump_data_version(db.session, [username])
+    if commit:
         db.session.commit()
-
-        # Add Pokémon to the team
-        for nickname, pokemon_data in players[team_key].team.items():
-            team_pokemon = TeamPokemon(
-                team_id=team.id,
-                nickname=nickname, 
-                pokemon_name=pokemon_data.name,
-                ispick=True if nickname in players[team_key].picks else False,
-                wins=pokemon_data.wins,
-                defeated=pokemon_data.defeated
-            )
-            db.session.add(team_pokemon)
-            db.session.commit()
-
-            # Add moves for the Pokémon
-            for move_name, times_used in pokemon_data.moves.items():
-                move_usage = MoveUsage(
-                    team_pokemon_id=team_pokemon.id,
-                    move_name=move_name,
-                    times_used=times_used
-                )
-                db.session.add(move_usage)
-
-    db.session.commit()
-
-    # Update match winner and ELO data
-    match.winner = parsed_log.winner
-    for player_key, player in parsed_log.players.items():
-        if len(player.elo) == 2: # don't add elo to db if game is not competitive
-            if player_key == "p1":
-                match.p1_initial_elo = player.elo[0]
-                match.p1_final_elo = player.elo[1]
-            elif player_key == "p2":
-                match.p2_initial_elo = player.elo[0]
-                match.p2_final_elo = player.elo[1]
+    return match
+
+def save_parsed_logs_to_db(parsed_logs, db, username):
+    """Saves a batch of parsed logs under `username` in a single transaction."""
+    # the sprites, species and moves of the whole batch are resolved together
+    lookups = resolve_lookups(db.session, parsed_logs)
+    matches = [build_match(parsed_log, username, lookups) for parsed_log in parsed_logs]
+    db.session.add_all(matches)
+    add_matches_to_stats(db.session, matches)
+    bump_data_version(db.session, [username])
     db.session.commit()
+    return matches
 
-def fetch_usr_matches_from_db(username):
-    """Returns a list of dictionaries representing matches for a given user."""
-    user = User.query.filter_by(username=username).first()
-    if not user: 
+def find_stored_replay_ids(replay_ids):
+    """Returns the subset of the canonical `replay_ids` that are already stored, 
+    using a single indexed query for the whole batch.
+    """
+    replay_ids = set(replay_ids)
+    if not replay_ids:
+        return set()
+    return set(db.session.scalars(select(Match.replay_id).where(Match.replay_id.in_(replay_ids))))
+
+def fetch_usr_match_page(username, cursor=None, limit=MATCH_PAGE_SIZE):
+    """Returns one page of a user's matches, newest first, and the cursor of the
+    next page (None on the last page).
+    Pages are found by keyset on `Match.id` rather than OFFSET, and matches are
+    numbered down from the user's stored `match_count` rather than by counting them,
+    so every page costs the same few indexed queries however many matches the user has.
+    -cursor: "<match id>:<match number>" of the last match on the previous page
+    """
+    match_count = db.session.scalar(select(User.match_count).where(User.username == username))
+    if match_count is None:
         raise Exception("User doesn't exist!")
 
-    match_list = []
-    user_matches = sorted(user.matches, key=lambda m: m.id)
-    for match_num, db_match in enumerate(user_matches, start=1):
-        match_entry = {}
-        match_entry["match_num"] = match_num
-        match_entry["id"] = db_match.id
-        match_entry["win"] = db_match.winner
-        match_entry["enemyname"] = db_match.enemyname
-        match_entry["replay_url"] = db_match.replay_url
-
-        # Get user and enemy teams
-        usr_team, enemy_team = db_match.teams
-
-        # Get sprite URLs for all Pokémon, preserving nicknames
-        match_entry["oppteam"] = [
-            (sprite_cache.get_sprite_url(p.pokemon_name), p.nickname if p.nickname else p.pokemon_name)
-            for p in enemy_team.pokemons
-        ]
-        match_entry["usr_picks"] = [
-            (sprite_cache.get_sprite_url(p.pokemon_name), p.nickname if p.nickname else p.pokemon_name)
-            for p in usr_team.pokemons if p.ispick
-        ]
-        match_entry["enemy_picks"] = [
-            (sprite_cache.get_sprite_url(p.pokemon_name), p.nickname if p.nickname else p.pokemon_name)
-            for p in enemy_team.pokemons if p.ispick
-        ]
-
-        # ELO data
-        match_entry["elo"] = [
-            db_match.p1_initial_elo, 
-            db_match.p1_final_elo, 
-            db_match.p2_initial_elo
-        ]
-
-        # Additional fields
-        match_entry["terastallize"] = [False, False]  # Placeholder
-        match_entry["OTS"] = False  # Placeholder
-
-        match_list.append(match_entry)
-
-    return match_list
-
-def fetch_pokemon_data_for_usr(username, active_match_id):
+    query = select(Match).where(Match.user_id == username)
+    if cursor is None:
+        match_num = match_count
+    else:
+        # raises ValueError if the cursor is malformed
+        before_id, last_num = map(int, cursor.split(":"))
+        query = query.where(Match.id < before_id)
+        match_num = last_num - 1
+
+    user_matches = db.session.scalars(
+        query.order_by(Match.id.desc())
+        .limit(limit + 1)
+        .options(selectinload(Match.teams).selectinload(Team.pokemons))
+    ).all()
+    page = [match_to_dict(match_num - i, db_match) for i, db_match in enumerate(user_matches[:limit])]
+    next_cursor = f"{page[-1]['id']}:{page[-1]['match_num']}" if len(user_matches) > limit else None
+    return page, next_cursor
+
+def match_to_dict(match_num, db_match):
+    """Returns the row of the match history table for `db_match`."""
+    match_entry = {}
+    match_entry["match_num"] = match_num
+    match_entry["id"] = db_match.id
+    match_entry["win"] = db_match.winner
+    match_entry["enemyname"] = db_match.enemyname
+    match_entry["replay_url"] = db_match.replay_url
+
+    # Get user and enemy teams
+    usr_team, enemy_team = db_match.teams
+
+    # Get sprite URLs for all Pokémon, preserving nicknames. They were resolved when
+    # the match was saved, only matches saved before then are looked up here
+    def sprite(p):
+        return p.sprite_url or sprite_cache.get_sprite_url(p.pokemon_name)
+
+    match_entry["oppteam"] = [
+        (sprite(p), p.nickname if p.nickname else p.pokemon_name)
+        for p in enemy_team.pokemons
+    ]
+    match_entry["usr_picks"] = [
+        (sprite(p), p.nickname if p.nickname else p.pokemon_name)
+        for p in usr_team.pokemons if p.ispick
+    ]
+    match_entry["enemy_picks"] = [
+        (sprite(p), p.nickname if p.nickname else p.pokemon_name)
+        for p in enemy_team.pokemons if p.ispick
+    ]
+
+    # ELO data
+    match_entry["elo"] = [
+        db_match.p1_initial_elo, 
+        db_match.p1_final_elo, 
+        db_match.p2_initial_elo
+    ]
+
+    # Additional fields
+    match_entry["terastallize"] = [False, False]  # Placeholder
+    match_entry["OTS"] = False  # Placeholder
+
+    return match_entry
+
+def fetch_pokemon_data_for_usr(username, active_match_id, filters=None):
     """
     Fetches information required for tables two and three. Including the 
     number of pokemon defeated by that pokemon, the number of matches won/lost, 
     and the number of times that pokemon used a particular move.
     -username: the username whos matches to search
     -active_match_id: the match whos pokemon you want information on 
+    -filters: keyword arguments of `MatchHistory.filter` (since, until, opponent, format),
+     to only count the matches they select
+    Totals are read from the user's running totals in `PokemonStats` and 
+    `PokemonMoveStats` (see `app.pokemon_stats`), one primary key lookup per Pokémon.
+    Filtered totals are computed from the user's columnar `MatchHistory` instead.
     """
-    target_match = Match.query.filter_by(id=active_match_id).first()
-    if not target_match:
+    if db.session.get(Match, active_match_id) is None:
         raise Exception("Active match doesn't exist!")
-    target_team = [t for t in target_match.teams if t.is_user_team][0]
-    target_pokemon = {p.pokemon_name for p in target_team.pokemons}
+    # we only care about pokemon in the active match
+    target_pokemon = (
+        select(TeamPokemon.species_id)
+        .join(Team, TeamPokemon.team_id == Team.id)
+        .where(Team.match_id == active_match_id, Team.is_user_team.is_(True))
+    )
 
-    user = User.query.filter_by(username=username).first()
-    if not user: 
+    if db.session.get(User, username) is None: 
         raise Exception("User doesn't exist!")
-    
+
+    if filters:
+        history = match_history_cache.get(username)
+        species = db.session.scalars(select(Species.name).where(Species.id.in_(target_pokemon))).all()
+        return history.pokemon_stats(history.filter(**filters), species=species)
+
     poke_dict = dict()
-    for db_match in user.matches:
-        won = int(db_match.winner != db_match.enemyname)
-        usr_team = [t for t in db_match.teams if t.is_user_team][0] 
-        for pokemon in usr_team.pokemons:
-            # we only care about pokemon in the active match
-            if pokemon.pokemon_name not in target_pokemon: continue
-            # construct dict if pokemon not already in poke_dict
-            if pokemon.pokemon_name not in poke_dict:
-                poke_dict[pokemon.pokemon_name] = {"moves":{}, "wins":0, "losses":0, "matches_won":0}
-            # construct or increment values for the active pokemon
-            cur_poke = poke_dict[pokemon.pokemon_name]
-            for mu in pokemon.move_usages: # add moves or increment move counts on existing moves
-                cur_poke["moves"][mu.move_name] = cur_poke["moves"].get(mu.move_name, 0) + mu.times_used
-            cur_poke["wins"] += pokemon.wins
-            cur_poke["losses"] += int(pokemon.defeated)
-            cur_poke["matches_won"] += won
-            cur_poke["truename"] =  pokemon.pokemon_name
+    stats = db.session.scalars(select(PokemonStats).where(
+        PokemonStats.username == username, PokemonStats.species_id.in_(target_pokemon)
+    ))
+    for row in stats:
+        poke_dict[row.pokemon_name] = {
+            "moves": {}, "wins": row.wins, "losses": row.losses, 
+            "matches_won": row.matches_won, "truename": row.pokemon_name
+        }
+
+    move_stats = db.session.scalars(select(PokemonMoveStats).where(
+        PokemonMoveStats.username == username, PokemonMoveStats.species_id.in_(target_pokemon)
+    ))
+    for row in move_stats:
+        poke_dict[row.pokemon_name]["moves"][row.move_name] = row.times_used
     return poke_dict
 
 def unpack_display_replay(replay):
@@ -0,0 +1,92 @@
+"""
+Read-through cache for the data behind the visualise page.
+
+A user's match list and Pokémon totals only change when their matches do, so results
+are cached under `(owner username, data version, ...)`. Every change to a user's matches
+bumps `User.data_version` (see `bump_data_version`), after which the old entries are
+never asked for again and age out of the LRU. Since the key uses the owner of the data,
+viewers of shared data reuse the owner's entries.
+
+Entries are kept in an in-process LRU. If `RESPONSE_CACHE_PATH` is set, they are also
+stored in a SQLite file there, so several worker processes can share them.
+
+Usage Example:
+
+    version = data_version(username)
+    matches = response_cache.get_or_compute((username, version, "matches", None), lambda: fetch_usr_match_page(username))
+"""
+import json
+import time
+
+from sqlalchemy import select, update
+
+from app import db
+from app.models import User
+from app.caching import LRUCache, SQLiteConnections
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_response_cache_last_used ON response_cache (last_used)",
+]
+
+def data_version(username):
+    """Returns the current data version of `username`, or None if they don't exist."""
+    return db.session.scalar(select(User.data_version).where(User.username == username))
+
+def bump_data_version(session, usernames):
+    """Marks the cached data of `usernames` as out of date, as part of the session's transaction."""
+    usernames = set(usernames)
+    if usernames:
+        session.execute(update(User).where(User.username.in_(usernames)).values(data_version=User.data_version + 1))
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = LRUCache(max_entries)
+        self._connections = SQLiteConnections(path, _SCHEMA)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get("RESPONSE_CACHE_SIZE", 1024)
+        self.path = app.config.get("RESPONSE_CACHE_PATH")
+        self._entries = LRUCache(self.max_entries)
+        self._connections = SQLiteConnections(self.path, _SCHEMA)
+
+    def get_or_compute(self, key, compute):
+        """Returns the value cached under `key`, calling `compute()` to fill it in on a miss."""
+        key = json.dumps(key)
+        value = self._get(key)
+        if value is None:
+            value = compute()
+            self._set(key, value)
+        return value
+
+    def _get(self, key):
+        value = self._entries.get(key)
+        if value is not None or self.path is None:
+            return value
+
+        conn = self._connections.get()
+        with conn:
+            row = conn.execute("SELECT value FROM response_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        value = json.loads(row[0])
+        self._entries.put(key, value)
+        return value
+
+    def _set(self, key, value):
+        self._entries.put(key, value)
+        if self.path is None:
+            return
+        conn = self._connections.get()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO response_cache (key, value, last_used) VALUES (?, ?, ?)",
+                         (key, json.dumps(value), time.time()))
+            # evict the least recently used entries shared by every process
+            conn.execute("DELETE FROM response_cache WHERE key IN ("
+                         "SELECT key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+# Create a global instance
+response_cache = ResponseCache()
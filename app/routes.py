@@ -1,5 +1,5 @@
 # Standard Flask and Flask-Login imports
-from flask import render_template, request, redirect, url_for, flash, session, jsonify
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 
 # App-specific imports
@@ -7,8 +7,12 @@ from app import db, login_manager
 from app.models import User, Match, Team, TeamPokemon, MoveUsage, SharedAccess
 from app.blueprints import main
 from app.replay_parser import *
+from app.ingest_jobs import ingest_queue
+from app.response_cache import response_cache, data_version
+from app.state_store import get_state, set_state, pop_state, clear_state
 
 import requests
+from datetime import datetime
 
 # --------------------------
 # Flask-Login user loader
@@ -53,7 +57,7 @@ def upload():
         # Collect and filter replay links (up to 40)
         replays = [request.form.get(f"replay_{i}", "").strip() for i in range(40)]
         replays = [r for r in replays if r]
-        session["replays"] = replays
+        set_state("replays", replays)
 
         # Proceed to visualisation
         return redirect(url_for("main.visualise"))
@@ -68,14 +72,13 @@ def upload():
 @main.route("/visualise", methods=["GET", "POST"])
 @login_required
 def visualise():
-    replay_urls = session.get("replays", [])
+    replay_urls = get_state("replays", [])
     data_submitted = bool(replay_urls)
+    ingest_job_id = None
 
-    # Updates session with user's parsed match logs
+    # Remembers whose parsed match logs are shown; they are loaded from the database when rendering
     def update_vis_session(name):
-        parsed_logs = fetch_usr_matches_from_db(name)
-        session["parsed_logs"] = parsed_logs
-        session["active_match_id"] = parsed_logs[-1]["id"]
+        set_state("vis_username", name)
 
     # Get all users who have shared their data with the current user
     shared_users = [s.owner_username for s in SharedAccess.query.filter_by(shared_with_username=current_user.username).all()]
@@ -103,33 +106,38 @@ def visualise():
                 flash("Invalid selection: You do not have access to this user's data.", "error")
                 return redirect(url_for("main.visualise"))
 
-    # Process uploaded replays if available
+    # Queue uploaded replays for background processing if available
     elif data_submitted:
-        for replay_url in replay_urls:
-            if Match.query.filter_by(replay_url=replay_url).first():
-                flash(f"Replay {replay_url} has already been processed.", "info")
-                continue
-
-            try:
-                parsed_log = ReplayLogParser(replay_url)
-                save_parsed_log_to_db(parsed_log, db, current_user.username)
-            except Exception as e:
-                flash(f"Failed to process replay {replay_url}: {str(e)}", "error")
-                continue
-
-        session.pop("replays", None)
+        job = ingest_queue.submit(current_user.username, replay_urls)
+        pop_state("replays")
+        if job.finished:
+            for message, category in job.messages():
+                flash(message, category)
+        else:
+            # the page polls the job's progress, and reloads once it's done
+            ingest_job_id = job.id
         update_vis_session(current_user.username)
 
     # Load existing data if user has history but no new submissions this session
-    elif "parsed_logs" not in session and current_user.showdown_username:
+    elif get_state("vis_username") is None and current_user.showdown_username:
         update_vis_session(current_user.username)
 
     # If no data, show empty visualisation
     if not (data_submitted or current_user.showdown_username):
         return render_template("visualise.html", parsed_logs=[], data_submitted=False, default_active_match_id=-1, shared_with=shared_users)
 
-    # Render visualisation with available data
-    return render_template("visualise.html", parsed_logs=session["parsed_logs"], data_submitted=True, default_active_match_id=session["active_match_id"], shared_with=shared_users)
+    # Render visualisation with the most recent matches; older ones are loaded as the user scrolls
+    parsed_logs, next_cursor = load_match_page(get_state("vis_username", current_user.username))
+    active_match_id = parsed_logs[0]["id"] if parsed_logs else -1
+    return render_template("visualise.html", parsed_logs=parsed_logs, next_cursor=next_cursor, data_submitted=True, default_active_match_id=active_match_id, shared_with=shared_users, ingest_job_id=ingest_job_id)
+
+
+def load_match_page(name, cursor=None):
+    """Returns a page of `name`'s matches, newest first, and the cursor of the next page."""
+    return response_cache.get_or_compute(
+        (name, data_version(name), "matches", cursor),
+        lambda: fetch_usr_match_page(name, cursor, current_app.config["MATCH_PAGE_SIZE"])
+    )
 
 
 # --------------------------
@@ -229,6 +237,7 @@ def signup():
 def logout():
     logout_user()
     flash("Logged out.", "info")
+    clear_state()  # Clear server-side state
     session.clear()  # Clear session data
     return redirect(url_for("main.index"))
 
@@ -241,10 +250,68 @@ def logout():
 def visualise_match_data(match_id):
     # Use shared_username if set, otherwise use current user's username
     username = session.get("shared_username", current_user.username)
-    data = fetch_pokemon_data_for_usr(username, match_id)
+    try:
+        filters = match_data_filters(request.args)
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid date."}), 400
+    key = (username, data_version(username), match_id)
+    if filters:
+        key += (sorted((name, str(value)) for name, value in filters.items()),)
+    data = response_cache.get_or_compute(key, lambda: fetch_pokemon_data_for_usr(username, match_id, filters))
     return jsonify(data)
 
 
+def match_data_filters(args):
+    """Reads the optional filters of the match data from the query string, e.g.
+    ?since=2025-01-01&until=2025-02-01&opponent=gary&opponent=misty&format=gen9ou
+    Dates are ISO 8601, and `until` is exclusive. Raises ValueError on an invalid date.
+    """
+    filters = {}
+    for name in ("since", "until"):
+        if args.get(name):
+            filters[name] = datetime.fromisoformat(args[name])
+    for name in ("opponent", "format"):
+        values = [value for value in args.getlist(name) if value]
+        if values:
+            filters[name] = values
+    return filters
+
+
+# --------------------------
+# Page of Match History (AJAX)
+# --------------------------
+@main.route("/visualise/matches")
+@login_required
+def visualise_matches():
+    name = get_state("vis_username", current_user.username)
+    try:
+        parsed_logs, next_cursor = load_match_page(name, request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid cursor."}), 400
+    return jsonify({
+        "matches": parsed_logs,
+        "next_cursor": next_cursor,
+        "html": render_template("_match_rows.html", parsed_logs=parsed_logs),
+    })
+
+
+# --------------------------
+# Replay Ingestion Progress (AJAX)
+# --------------------------
+@main.route("/visualise/jobs/<job_id>")
+@login_required
+def ingest_job_status(job_id):
+    job = ingest_queue.get(job_id)
+    if not job or job.username != current_user.username:
+        return jsonify({"success": False, "message": "Job not found."}), 404
+
+    if job.finished:
+        # hand the per-replay messages over to the page reload, like a synchronous upload
+        for message, category in job.messages():
+            flash(message, category)
+    return jsonify(job.to_dict())
+
+
 # --------------------------
 # Set Shared User Context (AJAX)
 # --------------------------
@@ -1,30 +1,138 @@
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from functools import lru_cache
+
+from app.caching import LRUCache, SQLiteConnections
+from app.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+# sprites of each species' default form, by national dex number
+SPRITE_BASE_URL = "https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/"
+# the species data the sprite manifest is built from
+SHOWDOWN_POKEDEX_URL = "https://play.pokemonshowdown.com/data/pokedex.json"
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sprite_manifest.json")
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS sprites (pokemon_name TEXT PRIMARY KEY, sprite_url TEXT NOT NULL, fetched_at REAL NOT NULL)",
+]
+
+def sprite_key(pokemon_name):
+    """Normalises a species name as written in replays to its key in the sprite manifest,
+    which is Showdown's ID of the species, e.g. "Nidoran♀" -> "nidoranf",
+    "Farfetch’d" -> "farfetchd", "Flabébé" -> "flabebe" and "Urshifu-*" (team preview) -> "urshifu".
+    """
+    name = pokemon_name.lower().replace("♀", "f").replace("♂", "m")
+    # strips accents, which Showdown's IDs leave out
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    if name.endswith("-*"):
+        name = name[:-2]
+    return re.sub(r"[^a-z0-9]", "", name)
+
+def build_sprite_manifest(pokedex):
+    """Returns the sprite manifest, `{sprite key: national dex number}`, from Showdown's
+    pokedex data. Only species' default forms are included; the sprites of other forms
+    (e.g. Calyrex-Shadow) have their own pokeapi IDs, so they are looked up remotely.
+    """
+    return {
+        key: entry["num"] for key, entry in sorted(pokedex.items())
+        if entry.get("num", 0) > 0 and "forme" not in entry
+    }
+
+def load_sprite_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
 
 class SpriteCache:
+    """
+    Looks up Pokémon sprite URLs.
+
+    Species are found in the bundled sprite manifest (see `flask build-sprite-manifest`),
+    without any network I/O. Other names, like most alternate forms, are looked up on
+    pokeapi.co. Those answers are kept in an in-process LRU in front of a SQLite file at
+    `SPRITE_CACHE_PATH`, shared by every worker process and kept across restarts,
+    so a cold worker doesn't go back to pokeapi for each form. Entries older
+    than `SPRITE_CACHE_TTL` seconds are looked up again; if that fails the old
+    URL is kept. With no `SPRITE_CACHE_PATH` only the in-process LRU is used.
+    """
     _instance = None
-    _cache = {}
     _default_sprite = "https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/0.png"
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(SpriteCache, cls).__new__(cls)
+            cls._instance.max_entries = 1000
+            cls._instance.path = None
+            cls._instance.ttl = 30 * 24 * 60 * 60
+            cls._instance._entries = LRUCache(1000)
+            cls._instance._connections = SQLiteConnections(None, _SCHEMA)
+            cls._instance.manifest = load_sprite_manifest()
         return cls._instance
 
-    @lru_cache(maxsize=1000)
+    def init_app(self, app):
+        self.max_entries = app.config.get("SPRITE_CACHE_SIZE", 1000)
+        self.path = app.config.get("SPRITE_CACHE_PATH")
+        self.ttl = app.config.get("SPRITE_CACHE_TTL", self.ttl)
+        self._entries = LRUCache(self.max_entries)
+        self._connections = SQLiteConnections(self.path, _SCHEMA)
+
     def get_sprite_url(self, pokemon_name: str) -> str:
         """
         Get the sprite URL for a Pokémon, using cache if available.
         Returns the default sprite if the Pokémon can't be found.
         """
+        # Species in the manifest need no lookup
+        dex_num = self.manifest.get(sprite_key(pokemon_name))
+        if dex_num is not None:
+            return f"{SPRITE_BASE_URL}{dex_num}.png"
+
         # Check if we already have this Pokémon cached
-        if pokemon_name in self._cache:
-            return self._cache[pokemon_name]
+        entry = self._get(pokemon_name)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            return entry[0]
+
+        sprite_url = self._fetch_sprite_url(pokemon_name)
+        if sprite_url is None:
+            # nothing is cached after a failed lookup: `http_client` remembers the failure
+            # briefly, and the name is looked up again after that
+            return entry[0] if entry is not None else self._default_sprite
+        self._set(pokemon_name, sprite_url)
+        return sprite_url
 
+    def get_sprite_urls(self, pokemon_names, max_workers=8) -> dict:
+        """
+        Get sprite URLs for many Pokémon at once, as {name: sprite URL}.
+        The names that need a remote lookup are looked up in parallel.
+        """
+        names = list(dict.fromkeys(pokemon_names))
+        remote = [name for name in names if sprite_key(name) not in self.manifest]
+        sprite_urls = {}
+        if len(remote) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(remote))) as pool:
+                sprite_urls.update(zip(remote, pool.map(self.get_sprite_url, remote)))
+        for name in names:
+            if name not in sprite_urls:
+                sprite_urls[name] = self.get_sprite_url(name)
+        return sprite_urls
+
+    def _fetch_sprite_url(self, pokemon_name):
+        """Asks pokeapi for the sprite of `pokemon_name`. Returns the default sprite
+        if pokeapi doesn't know it, or None if the request fails.
+        """
         try:
             # Clean the name for the API (handle special cases)
-            clean_name = pokemon_name.lower()
-            print(f"Original name: {pokemon_name}, Cleaned name: {clean_name}")  # Debug log
+            clean_name = pokemon_name.lower().removesuffix("-*").replace(" ", "-")
+            clean_name = re.sub(r"[.:’']", "", clean_name)
+            logger.debug("Original name: %s, Cleaned name: %s", pokemon_name, clean_name)
 
             # Handle special cases like "Nidoran♀" or "Nidoran♂"
             if "♀" in clean_name:
@@ -32,36 +140,58 @@ class SpriteCache:
             elif "♂" in clean_name:
                 clean_name = "nidoran-m"
 
-            print(f"Final cleaned name: {clean_name}")  # Debug log
+            logger.debug("Final cleaned name: %s", clean_name)
 
             url = f"https://pokeapi.co/api/v2/pokemon/{clean_name}/"
-            print(f"Requesting URL: {url}")  # Debug log
-            response = requests.get(url)
+            logger.debug("Requesting URL: %s", url)
+            response = http_client.get(url)
+            if response.status_code == 404:
+                logger.warning("No Pokémon named %s on pokeapi", clean_name)
+                return self._default_sprite
             response.raise_for_status()
             jsondata = response.json()
-            
+
             # Get the sprite URL from the response
             if 'sprites' in jsondata and 'front_default' in jsondata['sprites']:
                 sprite_url = jsondata['sprites']['front_default']
                 if sprite_url:  # Make sure we got a valid URL
-                    print(f"Found sprite URL: {sprite_url}")  # Debug log
-                    # Cache the result
-                    self._cache[pokemon_name] = sprite_url
+                    logger.debug("Found sprite URL: %s", sprite_url)
                     return sprite_url
-            
+
             # If we get here, either sprites or front_default was missing
-            print(f"Warning: No sprite found for {pokemon_name} (cleaned as {clean_name})")
-            self._cache[pokemon_name] = self._default_sprite
+            logger.warning("No sprite found for %s (cleaned as %s)", pokemon_name, clean_name)
             return self._default_sprite
-            
+
         except requests.exceptions.RequestException as e:
-            print(f"Error fetching sprite for {pokemon_name}: {str(e)}")
-            self._cache[pokemon_name] = self._default_sprite
-            return self._default_sprite
+            logger.warning("Error fetching sprite for %s: %s", pokemon_name, e)
+            return None
         except Exception as e:
-            print(f"Unexpected error for {pokemon_name}: {str(e)}")
-            self._cache[pokemon_name] = self._default_sprite
-            return self._default_sprite
+            logger.exception("Unexpected error for %s", pokemon_name)
+            return None
+
+    def _get(self, pokemon_name):
+        """Returns the cached `(sprite URL, time fetched)` of `pokemon_name`, or None."""
+        entry = self._entries.get(pokemon_name)
+        if entry is not None or self.path is None:
+            return entry
+
+        row = self._connections.get().execute(
+            "SELECT sprite_url, fetched_at FROM sprites WHERE pokemon_name = ?", (pokemon_name,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._entries.put(pokemon_name, (row[0], row[1]))
+        return (row[0], row[1])
+
+    def _set(self, pokemon_name, sprite_url):
+        entry = (sprite_url, time.time())
+        self._entries.put(pokemon_name, entry)
+        if self.path is None:
+            return
+        conn = self._connections.get()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO sprites (pokemon_name, sprite_url, fetched_at) VALUES (?, ?, ?)",
+                         (pokemon_name,) + entry)
 
     def get_sprites_for_pokemon_list(self, pokemon_list: list) -> list:
         """
@@ -71,4 +201,4 @@ class SpriteCache:
         return [{'sprite_url': self.get_sprite_url(name), 'pokemon_name': name} for name in pokemon_list]
 
 # Create a global instance
-sprite_cache = SpriteCache() 
\ No newline at end of file
+sprite_cache = SpriteCache()
@@ -0,0 +1,130 @@
+"""
+Server-side storage for per-visitor state that is too big for the session cookie.
+
+Flask keeps `session` in a signed cookie, so everything put in it is sent back and
+re-verified on every request, and it silently breaks past about 4 KB. State like the
+uploaded replay URLs or the list of parsed matches is kept here instead, in a SQLite
+file, and the cookie only holds a random `state_id`. Entries expire `STATE_STORE_TTL`
+seconds after they were last written. With no `STATE_STORE_PATH` entries are kept in memory.
+
+Usage Example:
+
+    set_state("replays", replay_urls)
+    replay_urls = get_state("replays", [])
+    pop_state("replays")
+"""
+import json
+import secrets
+import threading
+import time
+
+from flask import session
+
+from app.caching import SQLiteConnections
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS state (state_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+    "expires_at REAL NOT NULL, PRIMARY KEY (state_id, key))",
+    "CREATE INDEX IF NOT EXISTS ix_state_expires_at ON state (expires_at)",
+]
+
+class StateStore:
+    # expired entries are purged at most this often, in seconds
+    _purge_interval = 60
+
+    def __init__(self, path=None, ttl=24 * 60 * 60):
+        self.path = path
+        self.ttl = ttl
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._connections = SQLiteConnections(path, _SCHEMA)
+        self._last_purge = 0
+
+    def init_app(self, app):
+        self.path = app.config.get("STATE_STORE_PATH")
+        self.ttl = app.config.get("STATE_STORE_TTL", self.ttl)
+        with self._lock:
+            self._memory.clear()
+        self._connections = SQLiteConnections(self.path, _SCHEMA)
+
+    def get(self, state_id, key, default=None):
+        """Returns the value stored under `key` for `state_id`, or `default` if there is none."""
+        now = time.time()
+        if self.path is None:
+            with self._lock:
+                entry = self._memory.get((state_id, key))
+            return entry[1] if entry and entry[0] > now else default
+
+        row = self._connections.get().execute(
+            "SELECT value FROM state WHERE state_id = ? AND key = ? AND expires_at > ?", (state_id, key, now)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, state_id, key, value):
+        """Stores `value` (anything JSON serialisable) under `key` for `state_id`."""
+        expires_at = time.time() + self.ttl
+        if self.path is None:
+            with self._lock:
+                self._memory[(state_id, key)] = (expires_at, value)
+            return
+
+        conn = self._connections.get()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO state (state_id, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                         (state_id, key, json.dumps(value), expires_at))
+        self._purge_expired()
+
+    def delete(self, state_id, key=None):
+        """Removes `key` for `state_id`, or all of its state if no `key` is given."""
+        if self.path is None:
+            with self._lock:
+                for k in [k for k in self._memory if k[0] == state_id and key in (None, k[1])]:
+                    del self._memory[k]
+            return
+
+        conn = self._connections.get()
+        with conn:
+            if key is None:
+                conn.execute("DELETE FROM state WHERE state_id = ?", (state_id,))
+            else:
+                conn.execute("DELETE FROM state WHERE state_id = ? AND key = ?", (state_id, key))
+
+    def _purge_expired(self):
+        now = time.time()
+        if now - self._last_purge < self._purge_interval:
+            return
+        self._last_purge = now
+        conn = self._connections.get()
+        with conn:
+            conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+
+# Create a global instance
+state_store = StateStore()
+
+def _state_id(create=False):
+    """Returns the current visitor's state ID, giving them one if `create` is set."""
+    state_id = session.get("state_id")
+    if state_id is None and create:
+        state_id = session["state_id"] = secrets.token_urlsafe(32)
+    return state_id
+
+def get_state(key, default=None):
+    state_id = _state_id()
+    return default if state_id is None else state_store.get(state_id, key, default)
+
+def set_state(key, value):
+    state_store.set(_state_id(create=True), key, value)
+
+def pop_state(key, default=None):
+    state_id = _state_id()
+    if state_id is None:
+        return default
+    value = state_store.get(state_id, key, default)
+    state_store.delete(state_id, key)
+    return value
+
+def clear_state():
+    """Forgets all of the current visitor's state, e.g. on logout."""
+    state_id = session.pop("state_id", None)
+    if state_id is not None:
+        state_store.delete(state_id)
@@ -0,0 +1,43 @@
+document.addEventListener('DOMContentLoaded', function () {
+  const container = document.getElementById('ingest-progress');
+  if (!container) return;
+
+  const jobId = container.getAttribute('data-job-id');
+  const count = container.querySelector('.ingest-count');
+  const list = container.querySelector('.ingest-replays');
+  const POLL_INTERVAL = 1000; // ms
+
+  // Shows the state of each replay in the job
+  function render(job) {
+    count.textContent = `${job.done} / ${job.total}`;
+    list.innerHTML = '';
+    for (const replay of job.replays) {
+      const li = document.createElement('li');
+      li.className = `ingest-replay ${replay.status}`;
+      li.textContent = replay.message || `${replay.url}: ${replay.status}`;
+      list.appendChild(li);
+    }
+  }
+
+  async function poll() {
+    try {
+      const res = await fetch(`/visualise/jobs/${jobId}`);
+      if (!res.ok) {
+        // The job has expired or can't be seen from here; reload to show whatever was saved
+        location.reload();
+        return;
+      }
+      const job = await res.json();
+      render(job);
+      if (job.status === 'finished') {
+        location.reload(); // Refresh page to show the new matches and any errors
+        return;
+      }
+    } catch (err) {
+      console.error('Failed to fetch replay progress:', err);
+    }
+    setTimeout(poll, POLL_INTERVAL);
+  }
+
+  poll();
+});
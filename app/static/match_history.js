@@ -0,0 +1,40 @@
+document.addEventListener('DOMContentLoaded', function () {
+  const sentinel = document.getElementById('match-history-more');
+  if (!sentinel) return;
+
+  const tbody = document.querySelector('.replay-record tbody');
+  let nextCursor = sentinel.getAttribute('data-next-cursor');
+  let loading = false;
+
+  // Appends the next page of older matches to the table
+  async function loadMore() {
+    if (loading || !nextCursor) return;
+    loading = true;
+    try {
+      const res = await fetch(`/visualise/matches?cursor=${encodeURIComponent(nextCursor)}`);
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const page = await res.json();
+      tbody.insertAdjacentHTML('beforeend', page.html);
+      nextCursor = page.next_cursor;
+    } catch (err) {
+      console.error('Failed to load older matches:', err);
+      sentinel.textContent = 'Failed to load older matches.';
+      observer.disconnect();
+      return;
+    }
+    loading = false;
+    if (!nextCursor) {
+      observer.disconnect();
+      sentinel.remove();
+    } else if (sentinelVisible) {
+      loadMore(); // Keep going while the end of the table is still on screen
+    }
+  }
+
+  let sentinelVisible = false;
+  const observer = new IntersectionObserver(entries => {
+    sentinelVisible = entries[0].isIntersecting;
+    if (sentinelVisible) loadMore();
+  }, { rootMargin: '200px' });
+  observer.observe(sentinel);
+});
@@ -32,15 +32,18 @@ document.addEventListener("DOMContentLoaded", function() {
       console.error("Failed to parse pokemon data JSON:", e);
     }
   }
-  document.querySelectorAll(".replay-record tbody tr").forEach(row => {
-    row.addEventListener("click", function() {
+  // Listen on the table body, so rows of older matches loaded later are handled too
+  document.querySelectorAll(".replay-record tbody").forEach(tbody => {
+    tbody.addEventListener("click", function(event) {
+      const row = event.target.closest("tr");
+      if (!row) return;
       // Remove 'active' class from all rows
       document.querySelectorAll(".replay-record tbody tr").forEach(r => r.classList.remove("active"));
       // Add 'active' class to the clicked row
-      this.classList.add("active");
+      row.classList.add("active");
 
       // Get the match id from the data attribute
-      const matchId = this.getAttribute("data-match-id");
+      const matchId = row.getAttribute("data-match-id");
       console.log("Clicked row, matchId:", matchId);
       if (matchId) {
         fetch(`/visualise/match_data/${matchId}`)
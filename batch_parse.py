@@ -0,0 +1,121 @@
+"""
+Bulk-loads Pokémon Showdown `.log` files into the database under an existing user.
+
+Logs are parsed across every core with a process pool, then saved by this process
+in batched transactions, so backfills of thousands of historical replays don't have to go through the
+40-URL upload form.
+
+Usage Example:
+
+    python batch_parse.py path/to/logs/ ash
+    python batch_parse.py path/to/logs.tar.gz ash --workers 8
+
+The replay URL stored for each match is rebuilt from its file name,
+e.g. "gen9vgc2025regg-2334903558.log" -> ".../gen9vgc2025regg-2334903558"
+"""
+import argparse
+import os
+import sys
+import tarfile
+import time
+
+from sqlalchemy import select
+
+from app import create_app, db
+from config import DeploymentConfig
+from app.models import User, Match
+from app.replay_parser import ReplayLogParser, save_parsed_logs_to_db, replay_url_for_file
+from app.replay_cache import replay_cache, canonical_replay_id
+from app.parallel import map_in_processes, save_batch
+
+
+def iter_log_sources(path):
+    """Yields `(name, data)` for every `.log` under `path`.
+    For a directory `data` is None and workers read the file themselves,
+    for a tarball the member's bytes are read here and shipped to the worker.
+    """
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for filename in sorted(files):
+                if filename.endswith(".log"):
+                    yield os.path.join(root, filename), None
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(".log"):
+                    yield member.name, tar.extractfile(member).read()
+    else:
+        raise ValueError(f"{path} is neither a directory nor a tarball")
+
+
+def parse_log_source(source):
+    """Worker entry point. Returns `(name, parsed_log, error)`; errors are
+    returned as strings, as not every exception can be pickled back to the parent.
+    Logs that parse are also added to the replay log cache.
+    """
+    name, data = source
+    try:
+        if data is None:
+            with open(name, "rb") as f:
+                data = f.read()
+        replay_url = replay_url_for_file(name)
+        parsed_log = ReplayLogParser.from_bytes(data, replay_url)
+        # keep the raw log, so the replay can be reparsed later without a download
+        replay_cache.put(canonical_replay_id(replay_url), data)
+        return name, parsed_log, None
+    except Exception as e:
+        return name, None, f"{type(e).__name__}: {e}"
+
+
+def main(argv=None, config_class=DeploymentConfig):
+    arg_parser = argparse.ArgumentParser(description="Parse a directory or tarball of Showdown .log files into the database.")
+    arg_parser.add_argument("path", help="directory or tarball containing .log files")
+    arg_parser.add_argument("username", help="LugiAnalytics user the matches are saved under")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of parser processes (default: all cores)")
+    arg_parser.add_argument("--batch-size", type=int, default=500, help="number of replays saved per transaction (default: 500)")
+    args = arg_parser.parse_args(argv)
+
+    app = create_app(config_class)
+    with app.app_context():
+        if not db.session.get(User, args.username):
+            arg_parser.error(f"user '{args.username}' doesn't exist")
+        seen_ids = set(db.session.scalars(select(Match.replay_id)))
+
+        saved, skipped, failures, batch = 0, 0, [], []
+
+        def flush_batch():
+            nonlocal saved
+            batch_failures = save_batch(
+                lambda pairs: save_parsed_logs_to_db([parsed_log for _, parsed_log in pairs], db, args.username),
+                batch, db.session.rollback,
+            )
+            saved += len(batch) - len(batch_failures)
+            failures.extend(batch_failures)
+            batch.clear()
+
+        start = time.perf_counter()
+        for name, parsed_log, error in map_in_processes(parse_log_source, iter_log_sources(args.path), args.workers):
+            if error is not None:
+                failures.append((name, error))
+            elif canonical_replay_id(parsed_log.replay_url) in seen_ids:
+                skipped += 1
+            else:
+                seen_ids.add(canonical_replay_id(parsed_log.replay_url))
+                batch.append((name, parsed_log))
+                if len(batch) >= args.batch_size:
+                    flush_batch()
+        if batch:
+            flush_batch()
+        elapsed = time.perf_counter() - start
+
+    total = saved + skipped + len(failures)
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {total} replays in {elapsed:.2f}s ({rate:.1f} replays/s): "
+          f"{saved} saved, {skipped} already stored, {len(failures)} failed")
+    for name, error in failures:
+        print(f"  FAILED {name}: {error}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
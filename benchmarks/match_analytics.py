@@ -0,0 +1,146 @@
+"""
+Benchmarks the filtered Pokémon totals of one user with a large match history,
+comparing NumPy's vectorized group-bys over the columnar `MatchHistory` against
+dict loops over the same rows, for a handful of date, opponent and format filters.
+
+Usage Example:
+
+    python benchmarks/match_analytics.py                  # 20k matches
+    python benchmarks/match_analytics.py --matches 100000 --repeat 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from app import create_app, db
+from config import TestConfig
+from app.models import User, Match, Team, TeamPokemon, MoveUsage, Species, Move
+from app.match_analytics import MatchHistory
+
+SPECIES = [f"Species{i}" for i in range(300)]
+MOVES = [f"Move{i}" for i in range(400)]
+FORMATS = ["gen9ou", "gen9vgc2025regg", "gen9randombattle", "gen8ou"]
+OPPONENTS = [f"rival{i}" for i in range(200)]
+START = datetime(2024, 1, 1)
+
+FILTERS = [
+    ("every match", {}),
+    ("one format", {"format": "gen9vgc2025regg"}),
+    ("one opponent", {"opponent": "rival7"}),
+    ("last 90 days", {"since": START + timedelta(days=275)}),
+    ("date range and format", {"since": START + timedelta(days=30), "until": START + timedelta(days=120), "format": ["gen9ou", "gen8ou"]}),
+]
+
+
+def populate(n_matches):
+    """Fills the database with `n_matches` of one user, against random opponents in
+    random formats over a year, each with two teams of six Pokémon that used four moves each.
+    """
+    db.session.execute(insert(User), [{"username": "user", "email": "user@email.com", "password": "x"}])
+    db.session.execute(insert(Species), [{"id": i, "name": name} for i, name in enumerate(SPECIES, start=1)])
+    db.session.execute(insert(Move), [{"id": i, "name": name} for i, name in enumerate(MOVES, start=1)])
+
+    matches, teams, pokemon, moves = [], [], [], []
+    for match_id in range(1, n_matches + 1):
+        opponent = random.choice(OPPONENTS)
+        replay_id = f"{random.choice(FORMATS)}-{match_id}"
+        matches.append({"id": match_id, "user_id": "user", "enemyname": opponent, "winner": random.choice(["user", opponent]),
+                        "replay_url": f"https://replay.pokemonshowdown.com/{replay_id}", "replay_id": replay_id,
+                        "played_at": START + timedelta(seconds=random.randint(0, 365 * 24 * 60 * 60))})
+        for is_user_team in (True, False):
+            team_id = len(teams) + 1
+            teams.append({"id": team_id, "match_id": match_id, "is_user_team": is_user_team})
+            for species_id in random.sample(range(1, len(SPECIES) + 1), 6):
+                pokemon_id = len(pokemon) + 1
+                pokemon.append({"id": pokemon_id, "team_id": team_id, "species_id": species_id, "nickname": None,
+                                "ispick": True, "wins": random.randint(0, 2), "defeated": random.random() < 0.5})
+                moves.extend({"team_pokemon_id": pokemon_id, "move_id": m, "times_used": random.randint(1, 5)}
+                             for m in random.sample(range(1, len(MOVES) + 1), 4))
+
+    for model, rows in ((Match, matches), (Team, teams), (TeamPokemon, pokemon), (MoveUsage, moves)):
+        db.session.execute(insert(model), rows)
+    db.session.commit()
+
+
+def dict_loop_stats(history, since=None, until=None, opponent=None, format=None):
+    """The same totals as `MatchHistory.pokemon_stats`, worked out a row at a time in dicts."""
+    opponents = None if opponent is None else {name.lower() for name in ([opponent] if isinstance(opponent, str) else opponent)}
+    formats = None if format is None else set([format] if isinstance(format, str) else format)
+    selected = []
+    for played_at, opponent_code, format_code in zip(history.played_at.tolist(), history.opponent_codes.tolist(), history.format_codes.tolist()):
+        selected.append(
+            (since is None or (played_at is not None and played_at >= since))
+            and (until is None or (played_at is not None and played_at < until))
+            and (opponents is None or history.opponents[opponent_code] in opponents)
+            and (formats is None or history.formats[format_code] in formats)
+        )
+    won = history.won.tolist()
+    result = {}
+    pokemon_rows = zip(history.pokemon_match.tolist(), history.pokemon_species.tolist(),
+                       history.pokemon_wins.tolist(), history.pokemon_defeated.tolist())
+    for match, species, wins, defeated in pokemon_rows:
+        if not selected[match]: continue
+        name = history.species_names[species]
+        row = result.setdefault(name, {"moves": {}, "wins": 0, "losses": 0, "matches_won": 0, "truename": name})
+        row["wins"] += wins
+        row["losses"] += defeated
+        row["matches_won"] += won[match]
+    match_of_pokemon, species_of_pokemon = history.pokemon_match.tolist(), history.pokemon_species.tolist()
+    for pokemon, move, times_used in zip(history.move_pokemon.tolist(), history.move_codes.tolist(), history.move_times_used.tolist()):
+        if not selected[match_of_pokemon[pokemon]]: continue
+        moves = result[history.species_names[species_of_pokemon[pokemon]]]["moves"]
+        move_name = history.move_names[move]
+        moves[move_name] = moves.get(move_name, 0) + times_used
+    return result
+
+
+def best_time(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Time filtered Pokémon totals over a large match history.")
+    arg_parser.add_argument("--matches", type=int, default=20000, help="matches in the user's history (default: 20000)")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="runs per filter; the best is reported (default: 5)")
+    args = arg_parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        class BenchmarkConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+        app = create_app(BenchmarkConfig)
+        with app.app_context():
+            db.create_all()
+            random.seed(0)
+            populate(args.matches)
+
+            start = time.perf_counter()
+            history = MatchHistory.load(db.session, "user")
+            print(f"Loaded {len(history.match_ids)} matches, {len(history.pokemon_match)} Pokémon "
+                  f"and {len(history.move_pokemon)} move usages in {time.perf_counter() - start:.2f}s\n")
+
+            print(f"{'filter':>22} {'dict loops ms':>14} {'numpy ms':>9} {'speedup':>8}")
+            for description, filters in FILTERS:
+                # both must agree before their speed means anything
+                assert dict_loop_stats(history, **filters) == history.pokemon_stats(history.filter(**filters))
+                before = best_time(lambda: dict_loop_stats(history, **filters), args.repeat)
+                after = best_time(lambda: history.pokemon_stats(history.filter(**filters)), args.repeat)
+                print(f"{description:>22} {before * 1000:>14.1f} {after * 1000:>9.1f} {before / after:>7.1f}x")
+            db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measures how much memory parsed replays take while they are held in bulk, as
+batch_parse.py does, comparing the slotted classes and interned names the parser
+uses against plain dataclasses with a new string for every name in every replay.
+
+Usage Example:
+
+    python benchmarks/parser_memory.py
+    python benchmarks/parser_memory.py --replays 2000 --turns 50
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import replay_parser
+from app.replay_parser import ReplayLogParser
+from synthetic_logs import generate_log
+
+
+@dataclass
+class LegacyPokemon:
+    name: str = ""
+    moves: dict = field(default_factory=dict)
+    wins: int = 0
+    defeated: bool = False
+
+@dataclass
+class LegacyPlayer:
+    name: str = ""
+    team: dict = field(default_factory=dict)
+    picks: set = field(default_factory=set)
+    elo: list = field(default_factory=list)
+
+
+def bytes_per_replay(logs):
+    """Returns the memory taken by each replay in `logs` once parsed, on average."""
+    gc.collect()
+    tracemalloc.start()
+    parsed = [ReplayLogParser.from_bytes(data) for data in logs]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(parsed)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Measure the memory footprint of parsed replays.")
+    arg_parser.add_argument("--replays", type=int, default=1000, help="replays held at once (default: 1000)")
+    arg_parser.add_argument("--turns", type=int, default=30, help="turns per generated battle (default: 30)")
+    args = arg_parser.parse_args(argv)
+
+    logs = [generate_log(args.turns, seed) for seed in range(args.replays)]
+    with mock.patch.multiple(replay_parser, Pokemon=LegacyPokemon, Player=LegacyPlayer, intern=lambda name: name):
+        before = bytes_per_replay(logs)
+    after = bytes_per_replay(logs)
+
+    print(f"{args.replays} replays of {args.turns} turns held at once")
+    print(f"plain dataclasses, new strings: {before:>8,.0f} bytes per replay")
+    print(f"slots, interned names:          {after:>8,.0f} bytes per replay ({1 - after / before:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
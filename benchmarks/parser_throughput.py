@@ -0,0 +1,221 @@
+"""
+Benchmarks how fast replay logs are parsed, in lines per second, on synthetic battles
+of increasing length, comparing the parser against the way it used to tokenize every
+line of the log before dispatching on it. It then times what each of the parser's
+consumers adds to a pass over the log: reading the events it subscribes to, and
+handling them.
+
+Usage Example:
+
+    python benchmarks/parser_throughput.py                    # 100, 1000 and 5000 turn battles
+    python benchmarks/parser_throughput.py --turns 20000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.replay_parser import ReplayLogParser, ReplayConsumer, Player, Pokemon, intern
+from synthetic_logs import generate_log
+
+
+class LegacyReplayLogParser:
+    """Decodes every line and splits it on '|' before looking at it, and reads the
+    log to the end, working everything out in one loop, as the parser did before
+    lines were filtered by prefix and handed to consumers as events."""
+    def __init__(self, lines):
+        self.players = {"p1": Player(), "p2": Player()}
+        self.winner = None
+        self.last_attacker = ["", ""]
+        self.state = "players"
+        self._elo_player = 1
+        for line in lines:
+            self.parse_line(line.decode("utf-8").rstrip("\r\n"))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data.splitlines())
+
+    def parse_line(self, line):
+        if self.state == "players":
+            self.parsePlayerData(line)
+        elif self.state == "battle":
+            self.parseBattle(line)
+        else:
+            self.handleGameEnd(line)
+
+    def parseBattle(self, line):
+        line = line.split('|')
+        if len(line) < 2: return
+        match line[1]:
+            case 'win':
+                self.winner = line[2]
+                self.state = "end"
+            case 'switch':
+                active_p_num, nickname = line[2].split(": ")
+                nickname = intern(nickname)
+                pokemon_name = line[3].split(',')[0]
+                t = self.players[active_p_num[:2]].team
+                if nickname not in t and nickname != pokemon_name:
+                    pokemon_name = intern(pokemon_name)
+                    temp = Pokemon()
+                    temp.name = pokemon_name
+                    temp.moves = t[pokemon_name].moves.copy()
+                    temp.wins = t[pokemon_name].wins
+                    t.pop(pokemon_name)
+                    t[nickname] = temp
+                self.players[active_p_num[:2]].picks.add(nickname)
+            case 'move':
+                active_p_num, nickname = line[2].split(": ")
+                p_num = int(active_p_num[1])
+                self.last_attacker[p_num - 1] = nickname
+                moves = self.players[f"p{p_num}"].team[nickname].moves
+                times_used = moves.get(line[3])
+                if times_used is None:
+                    moves[intern(line[3])] = 1
+                else:
+                    moves[line[3]] = times_used + 1
+            case 'faint':
+                active_p_num, nickname = line[2].split(": ")
+                self.players[active_p_num[:2]].team[nickname].defeated = True
+                enemy_index = int(active_p_num[1]) % 2
+                attacker_pokemon = self.last_attacker[enemy_index]
+                self.players[f"p{enemy_index + 1}"].team[attacker_pokemon].wins += 1
+
+    def parsePlayerData(self, line):
+        line = line.split('|')
+        if len(line) < 2: return
+        match line[1]:
+            case 'start':
+                self.state = "battle"
+            case 'player':
+                self.players[line[2]].name = intern(line[3])
+            case 'poke':
+                pokemon_name = intern(line[3].split(',')[0].strip())
+                if pokemon_name:
+                    self.players[line[2]].team.setdefault(pokemon_name, Pokemon())
+                    self.players[line[2]].team[pokemon_name].name = pokemon_name
+
+    def handleGameEnd(self, line):
+        if line.startswith("|raw") and " rating: " in line:
+            line = line.split('|')
+            temp = line[2].find(" rating: ") + 9
+            cur_elo = line[2][temp:line[2].find(" ", temp)]
+            temp = line[2].find("<strong>") + 8
+            new_elo = line[2][temp:line[2].find("</strong>", temp)]
+            if self._elo_player <= 2:
+                self.players[f"p{self._elo_player}"].elo = [cur_elo, new_elo]
+            self._elo_player += 1
+
+
+def with_consumers(*consumer_types):
+    """Returns a function parsing a log with just `consumer_types`, to time them on their own."""
+    parser_class = type("Parser", (ReplayLogParser,), {"consumer_types": consumer_types})
+    def parse(data):
+        parser_class.incremental().feed(data)
+    return parse
+
+def subscriptions(consumer_type, earlier_types, data):
+    """Parses `data` with `consumer_type` after `earlier_types`, and returns, for each
+    kind it subscribes to, how many events of it it read before unsubscribing
+    (None if it never did).
+    """
+    seen, read = {}, {}
+    class Recording(consumer_type):
+        def unsubscribe(self, *kinds):
+            for kind in kinds:
+                read[kind] = seen.get(kind, 0)
+            super().unsubscribe(*kinds)
+    kinds = consumer_type().kinds()
+    for kind in kinds:
+        def handler(self, event, kind=kind, original=getattr(consumer_type, f"on_{kind}")):
+            seen[kind] = seen.get(kind, 0) + 1
+            original(self, event)
+        setattr(Recording, f"on_{kind}", handler)
+    with_consumers(*earlier_types, Recording)(data)
+    return {kind: read.get(kind) for kind in kinds}
+
+def reader_like(consumer_type, earlier_types, data):
+    """Returns a consumer type that reads the same events as `consumer_type` does from
+    `data`, unsubscribing at the same points, but does nothing with them: the baseline
+    that `consumer_type`'s handling of its events is measured against.
+    """
+    class Reader(ReplayConsumer):
+        def __init__(self):
+            self.seen = {}
+    for kind, limit in subscriptions(consumer_type, earlier_types, data).items():
+        def handler(self, event, kind=kind, limit=limit):
+            if limit is not None:
+                self.seen[kind] = self.seen.get(kind, 0) + 1
+                if self.seen[kind] == limit:
+                    self.unsubscribe(kind)
+        setattr(Reader, f"on_{kind}", handler)
+    return Reader
+
+
+def lines_per_second(parse, data, repeat):
+    """Returns the best rate at which `parse` parsed `data`, out of `repeat` runs."""
+    n_lines = data.count(b"\n")
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(data)
+        best = min(best, time.perf_counter() - start)
+    return n_lines / best
+
+
+def costs(data, parsers, repeat):
+    """Returns the best time each of `parsers` took per 1000 lines of `data`, in
+    microseconds, out of `repeat` runs taken in turns so that they are compared fairly.
+    """
+    n_lines = data.count(b"\n")
+    best = [float("inf")] * len(parsers)
+    for _ in range(repeat):
+        for i, parse in enumerate(parsers):
+            start = time.perf_counter()
+            parse(data)
+            best[i] = min(best[i], time.perf_counter() - start)
+    return [1e9 * t / n_lines for t in best]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Measure replay log parsing throughput.")
+    arg_parser.add_argument("--turns", type=int, nargs="+", default=[100, 1000, 5000],
+                            help="lengths of the generated battles, in turns (default: 100 1000 5000)")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="runs per battle; the best is reported (default: 5)")
+    args = arg_parser.parse_args(argv)
+
+    print(f"{'turns':>7} {'lines':>9} {'legacy lines/s':>15} {'lines/s':>12} {'speedup':>8}")
+    for turns in args.turns:
+        data = generate_log(turns)
+        n_lines = data.count(b"\n")
+        # both parsers must agree before their speed means anything
+        legacy, current = LegacyReplayLogParser.from_bytes(data), ReplayLogParser.from_bytes(data)
+        assert (legacy.players, legacy.winner) == (current.players, current.winner)
+
+        before = lines_per_second(LegacyReplayLogParser.from_bytes, data, args.repeat)
+        after = lines_per_second(ReplayLogParser.from_bytes, data, args.repeat)
+        print(f"{turns:>7} {n_lines:>9} {before:>15,.0f} {after:>12,.0f} {after / before:>7.2f}x")
+
+    # what each consumer adds to a pass over the longest battle. Each is added after
+    # the ones before it, which it relies on, and compared with reading the same events
+    data = generate_log(max(args.turns))
+    n_lines = data.count(b"\n")
+    print(f"\nconsumers, {max(args.turns)} turns ({n_lines} lines): microseconds per 1000 lines")
+    print(f"{'':>15} {'reading its events':>19} {'handling them':>14}")
+    print(f"{'splitting lines':>15} {costs(data, [with_consumers()], args.repeat)[0]:>19,.0f}")
+    earlier_types = ()
+    for consumer_type in ReplayLogParser.consumer_types:
+        before, reading, handling = costs(data, [
+            with_consumers(*earlier_types),
+            with_consumers(*earlier_types, reader_like(consumer_type, earlier_types, data)),
+            with_consumers(*earlier_types, consumer_type),
+        ], args.repeat * 4)
+        print(f"{consumer_type.__name__:>15} {reading - before:>+19,.0f} {handling - reading:>+14,.0f}")
+        earlier_types += (consumer_type,)
+
+
+if __name__ == "__main__":
+    main()
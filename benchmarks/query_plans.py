@@ -0,0 +1,129 @@
+"""
+Benchmarks the lookups behind the visualise page on a large synthetic database,
+printing SQLite's query plan and the mean time of each one.
+
+Usage Example:
+
+    python benchmarks/query_plans.py                     # 10k matches, with indexes
+    python benchmarks/query_plans.py --without-indexes   # the same, before the indexes
+    python benchmarks/query_plans.py --matches 50000
+
+A plan step reading "SCAN <table>" walks the whole table,
+"SEARCH <table> USING INDEX ..." only touches the matching rows.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+
+from app import create_app, db
+from config import TestConfig
+from app.models import User, Match, Team, TeamPokemon, MoveUsage, SharedAccess, Species, Move
+
+SPECIES = [f"Species{i}" for i in range(300)]
+MOVES = [f"Move{i}" for i in range(400)]
+FK_INDEXES = ["ix_match_user_id", "ix_team_match_id", "ix_team_pokemon_team_id",
+              "ix_move_usage_team_pokemon_id", "ix_shared_access_shared_with_username"]
+
+# (description, SQL, function returning the parameters for one lookup)
+QUERIES = [
+    ("matches of a user", "SELECT * FROM match WHERE user_id = :user ORDER BY id",
+     lambda ids: {"user": random.choice(ids["users"])}),
+    ("teams of a match", "SELECT * FROM team WHERE match_id = :id",
+     lambda ids: {"id": random.randint(1, ids["matches"])}),
+    ("pokemon of a team", "SELECT * FROM team_pokemon WHERE team_id = :id",
+     lambda ids: {"id": random.randint(1, ids["teams"])}),
+    ("moves of a pokemon", "SELECT * FROM move_usage WHERE team_pokemon_id = :id",
+     lambda ids: {"id": random.randint(1, ids["pokemon"])}),
+    ("users sharing with a user", "SELECT * FROM shared_access WHERE shared_with_username = :user",
+     lambda ids: {"user": random.choice(ids["users"])}),
+    ("share already exists", "SELECT * FROM shared_access WHERE owner_username = :owner AND shared_with_username = :user",
+     lambda ids: {"owner": random.choice(ids["users"]), "user": random.choice(ids["users"])}),
+    ("pokemon totals of a user",
+     "SELECT species.name, COUNT(*), SUM(team_pokemon.wins) FROM match "
+     "JOIN team ON team.match_id = match.id JOIN team_pokemon ON team_pokemon.team_id = team.id "
+     "JOIN species ON species.id = team_pokemon.species_id "
+     "WHERE match.user_id = :user AND team.is_user_team GROUP BY species.id",
+     lambda ids: {"user": random.choice(ids["users"])}),
+]
+
+
+def populate(n_matches, n_users):
+    """Fills the database with `n_matches` spread over `n_users`, each with
+    two teams of six Pokémon that used four moves each. Returns the id ranges.
+    """
+    users = [f"user{i}" for i in range(n_users)]
+    db.session.execute(insert(User), [{"username": u, "email": f"{u}@email.com", "password": "x"} for u in users])
+    db.session.execute(insert(SharedAccess), [
+        {"owner_username": users[i], "shared_with_username": users[(i + 1) % n_users]} for i in range(n_users)
+    ])
+
+    db.session.execute(insert(Species), [{"id": i, "name": name} for i, name in enumerate(SPECIES, start=1)])
+    db.session.execute(insert(Move), [{"id": i, "name": name} for i, name in enumerate(MOVES, start=1)])
+
+    matches, teams, pokemon, moves = [], [], [], []
+    for match_id in range(1, n_matches + 1):
+        matches.append({"id": match_id, "user_id": users[match_id % n_users], "winner": "a", "enemyname": "b",
+                        "replay_url": f"https://replay.pokemonshowdown.com/gen9ou-{match_id}", "replay_id": f"gen9ou-{match_id}"})
+        for is_user_team in (True, False):
+            team_id = len(teams) + 1
+            teams.append({"id": team_id, "match_id": match_id, "is_user_team": is_user_team})
+            for species_id in random.sample(range(1, len(SPECIES) + 1), 6):
+                pokemon_id = len(pokemon) + 1
+                pokemon.append({"id": pokemon_id, "team_id": team_id, "species_id": species_id, "nickname": None,
+                                "ispick": True, "wins": random.randint(0, 2), "defeated": random.random() < 0.5})
+                moves.extend({"team_pokemon_id": pokemon_id, "move_id": m, "times_used": random.randint(1, 5)}
+                             for m in random.sample(range(1, len(MOVES) + 1), 4))
+
+    for model, rows in ((Match, matches), (Team, teams), (TeamPokemon, pokemon), (MoveUsage, moves)):
+        db.session.execute(insert(model), rows)
+    db.session.commit()
+    return {"users": users, "matches": len(matches), "teams": len(teams), "pokemon": len(pokemon)}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Show query plans and timings for the visualise page's lookups.")
+    arg_parser.add_argument("--matches", type=int, default=10000, help="number of matches to generate (default: 10000)")
+    arg_parser.add_argument("--users", type=int, default=20, help="number of users the matches belong to (default: 20)")
+    arg_parser.add_argument("--repeat", type=int, default=200, help="lookups timed per query (default: 200)")
+    arg_parser.add_argument("--without-indexes", action="store_true", help="drop the foreign key indexes first")
+    args = arg_parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        class BenchmarkConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+        app = create_app(BenchmarkConfig)
+        with app.app_context():
+            db.create_all()
+            if args.without_indexes:
+                for index in FK_INDEXES:
+                    db.session.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+            start = time.perf_counter()
+            ids = populate(args.matches, args.users)
+            print(f"Generated {args.matches} matches in {time.perf_counter() - start:.1f}s "
+                  f"({'without' if args.without_indexes else 'with'} foreign key indexes), "
+                  f"{os.path.getsize(os.path.join(tmpdir, 'bench.db')) / 2**20:.1f} MiB on disk\n")
+
+            random.seed(0)
+            for description, sql, params in QUERIES:
+                plan = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params(ids)).all()
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    db.session.execute(text(sql), params(ids)).all()
+                mean_ms = (time.perf_counter() - start) / args.repeat * 1000
+                print(f"{description}: {mean_ms:.3f} ms")
+                for row in plan:
+                    print(f"    {row[-1]}")
+            db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
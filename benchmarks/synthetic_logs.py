@@ -0,0 +1,77 @@
+"""
+Generates synthetic Showdown battle logs of any length, for benchmarking the parser.
+
+The logs look like real doubles battles: each turn has timer, join and chat lines,
+moves followed by their damage and other effect lines, and every so often a faint
+and a switch, between two teams of six with a few nicknamed Pokémon. The battle ends
+with a win and both players' rating changes.
+
+Usage Example:
+
+    from synthetic_logs import generate_log
+    data = generate_log(turns=5000)  # bytes of a .log file
+"""
+import random
+
+SPECIES = ["Calyrex-Shadow", "Urshifu-Rapid-Strike", "Incineroar", "Rillaboom", "Amoonguss", "Tornadus",
+           "Miraidon", "Farigiraf", "Whimsicott", "Iron Hands", "Flutter Mane", "Chien-Pao"]
+MOVES = ["Astral Barrage", "Protect", "Fake Out", "Surging Strikes", "Grassy Glide", "Spore",
+         "Tailwind", "Draco Meteor", "Trick Room", "Moonblast", "Drain Punch", "Sacred Sword"]
+EFFECTS = ["|-damage|{target}|{hp}/100", "|-heal|{target}|{hp}/100 [from] item: Leftovers",
+           "|-boost|{target}|spa|1", "|-unboost|{target}|atk|1", "|-crit|{target}", "|-supereffective|{target}"]
+
+
+def generate_log(turns=1000, seed=0):
+    """Returns the bytes of a log of a battle lasting `turns` turns."""
+    rng = random.Random(seed)
+    players = {"p1": "Ash", "p2": "Gary"}
+    teams = {"p1": SPECIES[:6], "p2": SPECIES[6:]}
+    # a couple of Pokémon on each side go by a nickname
+    nicknames = {(side, species): (f"Nick{i}" if i % 3 == 0 else species)
+                 for side, team in teams.items() for i, species in enumerate(team)}
+    lines = ["|j|☆Ash", "|j|☆Gary", "|t:|1745000000", "|gametype|doubles"]
+    for side, name in players.items():
+        lines.append(f"|player|{side}|{name}|ethan|1500")
+    lines += ["|teamsize|p1|6", "|teamsize|p2|6", "|gen|9", "|tier|[Gen 9] VGC 2025 Reg G", "|rated|", "|clearpoke"]
+    for side, team in teams.items():
+        lines += [f"|poke|{side}|{species}, L50|" for species in team]
+    lines += ["|teampreview|4", "|", "|t:|1745000030", "|start"]
+
+    active = {}
+    def switch_in(slot, species):
+        side = slot[:2]
+        active[slot] = nicknames[(side, species)]
+        lines.append(f"|switch|{slot}: {active[slot]}|{species}, L50|100/100")
+
+    for slot, species in (("p1a", teams["p1"][0]), ("p1b", teams["p1"][1]), ("p2a", teams["p2"][0]), ("p2b", teams["p2"][1])):
+        switch_in(slot, species)
+
+    for turn in range(1, turns + 1):
+        lines += [f"|turn|{turn}", "|", f"|t:|{1745000030 + turn * 15}"]
+        if rng.random() < 0.2:
+            lines.append(f"|c|☆{rng.choice(list(players.values()))}|gl hf")
+        if rng.random() < 0.05:
+            lines.append(f"|j| spectator{rng.randrange(1000)}")
+        for slot in rng.sample(sorted(active), len(active)):
+            target_slot = rng.choice([s for s in active if s[:2] != slot[:2]])
+            target = f"{target_slot}: {active[target_slot]}"
+            lines.append(f"|move|{slot}: {active[slot]}|{rng.choice(MOVES)}|{target}")
+            for effect in rng.sample(EFFECTS, rng.randint(1, 3)):
+                lines.append(effect.format(target=target, hp=rng.randint(1, 100)))
+        # only Pokémon on a side whose opponents have already attacked can be knocked out
+        if turn > 1 and rng.random() < 0.1:
+            slot = rng.choice(sorted(active))
+            lines += [f"|-damage|{slot}: {active[slot]}|0 fnt", f"|faint|{slot}: {active[slot]}", "|upkeep"]
+            switch_in(slot, rng.choice(teams[slot[:2]]))
+        lines.append("|upkeep")
+
+    lines += ["|", "|win|Ash",
+              "|raw|Ash's rating: 1500 &rarr; <strong>1520</strong><br />(+20 for winning)",
+              "|raw|Gary's rating: 1480 &rarr; <strong>1460</strong><br />(-20 for losing)",
+              "|l|☆Gary"]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+if __name__ == "__main__":
+    import sys
+    sys.stdout.buffer.write(generate_log(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
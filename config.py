@@ -6,6 +6,33 @@ instance_db_path = os.path.join(basedir, "instance", "app.db")
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL") or f"sqlite:///{instance_db_path}"
     SECRET_KEY = os.getenv('SECRET_KEY')
+    # raw replay logs are cached here, so each replay is only downloaded once
+    REPLAY_CACHE_DIR = os.getenv("REPLAY_CACHE_DIR") or os.path.join(basedir, "instance", "replay_cache")
+    REPLAY_CACHE_MAX_BYTES = int(os.getenv("REPLAY_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    # background threads processing uploaded replays; 0 processes uploads within the request
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+    # cached match lists and Pokémon totals; set a path to share them between worker processes
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")
+    # users whose whole match history is held in memory as NumPy columns, for filtered totals
+    MATCH_HISTORY_CACHE_SIZE = int(os.getenv("MATCH_HISTORY_CACHE_SIZE", 16))
+    # matches per page of the match history; older pages are loaded as the user scrolls
+    MATCH_PAGE_SIZE = int(os.getenv("MATCH_PAGE_SIZE", 50))
+    # per-visitor state kept server-side, so the session cookie only holds an ID; expires after STATE_STORE_TTL seconds
+    STATE_STORE_PATH = os.getenv("STATE_STORE_PATH") or os.path.join(basedir, "instance", "state.db")
+    STATE_STORE_TTL = int(os.getenv("STATE_STORE_TTL", 24 * 60 * 60))
+    # sprite URLs looked up on pokeapi, shared by every worker process and looked up again after SPRITE_CACHE_TTL seconds
+    SPRITE_CACHE_PATH = os.getenv("SPRITE_CACHE_PATH") or os.path.join(basedir, "instance", "sprite_cache.db")
+    SPRITE_CACHE_TTL = int(os.getenv("SPRITE_CACHE_TTL", 30 * 24 * 60 * 60))
+    SPRITE_CACHE_SIZE = int(os.getenv("SPRITE_CACHE_SIZE", 1000))
+    # outbound HTTP (Showdown, pokeapi): timeouts and retries, how long a failed URL is
+    # remembered, and the failures in a row after which a host is left alone for a while
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+    HTTP_FAILURE_TTL = int(os.getenv("HTTP_FAILURE_TTL", 60))
+    HTTP_BREAKER_THRESHOLD = int(os.getenv("HTTP_BREAKER_THRESHOLD", 5))
+    HTTP_BREAKER_COOLDOWN = int(os.getenv("HTTP_BREAKER_COOLDOWN", 30))
 
 class DeploymentConfig(Config):
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + instance_db_path
@@ -15,6 +42,11 @@ class TestConfig(Config):
     TESTING = True
     SECRET_KEY = 'test-secret-key'
     WTF_CSRF_ENABLED = False
+    INGEST_WORKERS = 0
+    REPLAY_CACHE_DIR = None
+    STATE_STORE_PATH = None
+    SPRITE_CACHE_PATH = None
+    HTTP_RETRIES = 0
     SERVER_NAME = 'localhost.localdomain'  
     APPLICATION_ROOT = '/'                 
     PREFERRED_URL_SCHEME = 'http'          
@@ -0,0 +1,112 @@
+"""key pokemon totals on species and move ids
+
+Revision ID: 5dc23536621d
+Revises: 65984b4e23c6
+Create Date: 2026-10-18 21:30:17.897679
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5dc23536621d'
+down_revision = '65984b4e23c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the totals are derived from the match tables, so they are recreated keyed on
+    # the ids and filled in again (the same as `flask rebuild-pokemon-stats`)
+    op.drop_table('pokemon_move_stats')
+    op.drop_table('pokemon_stats')
+    pokemon_move_stats = op.create_table('pokemon_move_stats',
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('species_id', sa.Integer(), nullable=False),
+    sa.Column('move_id', sa.Integer(), nullable=False),
+    sa.Column('times_used', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['move_id'], ['move.id'], name='fk_pokemon_move_stats_move_id_move'),
+    sa.ForeignKeyConstraint(['species_id'], ['species.id'], name='fk_pokemon_move_stats_species_id_species'),
+    sa.ForeignKeyConstraint(['username'], ['user.username'], ),
+    sa.PrimaryKeyConstraint('username', 'species_id', 'move_id')
+    )
+    pokemon_stats = op.create_table('pokemon_stats',
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('species_id', sa.Integer(), nullable=False),
+    sa.Column('matches', sa.Integer(), nullable=False),
+    sa.Column('wins', sa.Integer(), nullable=False),
+    sa.Column('losses', sa.Integer(), nullable=False),
+    sa.Column('matches_won', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['species_id'], ['species.id'], name='fk_pokemon_stats_species_id_species'),
+    sa.ForeignKeyConstraint(['username'], ['user.username'], ),
+    sa.PrimaryKeyConstraint('username', 'species_id')
+    )
+    _fill_totals(pokemon_stats, pokemon_move_stats, by_name=False)
+
+
+def downgrade():
+    op.drop_table('pokemon_move_stats')
+    op.drop_table('pokemon_stats')
+    pokemon_move_stats = op.create_table('pokemon_move_stats',
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('pokemon_name', sa.String(), nullable=False),
+    sa.Column('move_name', sa.String(), nullable=False),
+    sa.Column('times_used', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['username'], ['user.username'], ),
+    sa.PrimaryKeyConstraint('username', 'pokemon_name', 'move_name')
+    )
+    pokemon_stats = op.create_table('pokemon_stats',
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('pokemon_name', sa.String(), nullable=False),
+    sa.Column('matches', sa.Integer(), nullable=False),
+    sa.Column('wins', sa.Integer(), nullable=False),
+    sa.Column('losses', sa.Integer(), nullable=False),
+    sa.Column('matches_won', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['username'], ['user.username'], ),
+    sa.PrimaryKeyConstraint('username', 'pokemon_name')
+    )
+    _fill_totals(pokemon_stats, pokemon_move_stats, by_name=True)
+
+
+def _fill_totals(pokemon_stats, pokemon_move_stats, by_name):
+    """Fills in the totals from the match tables, keyed on the species and move
+    names if `by_name` is set, or on their ids. Written with SQLAlchemy Core, so
+    "winner is distinct from enemyname" is rendered for each database.
+    """
+    match = sa.table('match', sa.column('id'), sa.column('user_id'), sa.column('winner'), sa.column('enemyname'))
+    team = sa.table('team', sa.column('id'), sa.column('match_id'), sa.column('is_user_team', sa.Boolean))
+    team_pokemon = sa.table('team_pokemon', sa.column('id'), sa.column('team_id'), sa.column('species_id'),
+                            sa.column('wins'), sa.column('defeated', sa.Boolean))
+    move_usage = sa.table('move_usage', sa.column('team_pokemon_id'), sa.column('move_id'), sa.column('times_used'))
+    species = sa.table('species', sa.column('id'), sa.column('name'))
+    move = sa.table('move', sa.column('id'), sa.column('name'))
+
+    user_pokemon = (
+        team_pokemon.join(team, team_pokemon.c.team_id == team.c.id)
+        .join(match, team.c.match_id == match.c.id)
+    )
+    user_moves = user_pokemon.join(move_usage, move_usage.c.team_pokemon_id == team_pokemon.c.id)
+    if by_name:
+        user_pokemon = user_pokemon.join(species, team_pokemon.c.species_id == species.c.id)
+        user_moves = user_moves.join(species, team_pokemon.c.species_id == species.c.id).join(move, move_usage.c.move_id == move.c.id)
+        pokemon_key, move_key = species.c.name, move.c.name
+    else:
+        pokemon_key, move_key = team_pokemon.c.species_id, move_usage.c.move_id
+
+    op.execute(pokemon_stats.insert().from_select(
+        [c.name for c in pokemon_stats.c],
+        sa.select(
+            match.c.user_id, pokemon_key, sa.func.count(team_pokemon.c.id),
+            sa.func.coalesce(sa.func.sum(team_pokemon.c.wins), 0),
+            sa.func.sum(sa.case((team_pokemon.c.defeated.is_(True), 1), else_=0)),
+            sa.func.sum(sa.case((match.c.winner.is_distinct_from(match.c.enemyname), 1), else_=0)),
+        ).select_from(user_pokemon).where(team.c.is_user_team.is_(True))
+        .group_by(match.c.user_id, pokemon_key)
+    ))
+    op.execute(pokemon_move_stats.insert().from_select(
+        [c.name for c in pokemon_move_stats.c],
+        sa.select(match.c.user_id, pokemon_key, move_key, sa.func.sum(move_usage.c.times_used))
+        .select_from(user_moves).where(team.c.is_user_team.is_(True))
+        .group_by(match.c.user_id, pokemon_key, move_key)
+    ))
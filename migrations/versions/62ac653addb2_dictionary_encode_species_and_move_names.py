@@ -0,0 +1,76 @@
+"""dictionary encode species and move names
+
+Revision ID: 62ac653addb2
+Revises: 44a9dfa501fe
+Create Date: 2026-10-18 21:02:02.282035
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '62ac653addb2'
+down_revision = '44a9dfa501fe'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('move',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('species',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    # every name already stored gets its id, and the rows refer to it instead
+    op.execute("INSERT INTO species (name) SELECT DISTINCT pokemon_name FROM team_pokemon ORDER BY pokemon_name")
+    op.execute("INSERT INTO move (name) SELECT DISTINCT move_name FROM move_usage ORDER BY move_name")
+
+    with op.batch_alter_table('move_usage', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('move_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_move_usage_move_id_move', 'move', ['move_id'], ['id'])
+    op.execute("UPDATE move_usage SET move_id = (SELECT id FROM move WHERE move.name = move_usage.move_name)")
+    with op.batch_alter_table('move_usage', schema=None) as batch_op:
+        batch_op.alter_column('move_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('move_name')
+
+    with op.batch_alter_table('team_pokemon', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('species_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_team_pokemon_species_id_species', 'species', ['species_id'], ['id'])
+    op.execute("UPDATE team_pokemon SET species_id = (SELECT id FROM species WHERE species.name = team_pokemon.pokemon_name)")
+    # a nickname is only kept if it differs from the species name
+    op.execute("UPDATE team_pokemon SET nickname = NULL WHERE nickname = pokemon_name")
+    with op.batch_alter_table('team_pokemon', schema=None) as batch_op:
+        batch_op.alter_column('species_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_team_pokemon_species_id'), ['species_id'], unique=False)
+        batch_op.drop_column('pokemon_name')
+
+
+def downgrade():
+    with op.batch_alter_table('team_pokemon', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('pokemon_name', sa.VARCHAR(), nullable=True))
+    op.execute("UPDATE team_pokemon SET pokemon_name = (SELECT name FROM species WHERE species.id = team_pokemon.species_id)")
+    op.execute("UPDATE team_pokemon SET nickname = pokemon_name WHERE nickname IS NULL")
+    with op.batch_alter_table('team_pokemon', schema=None) as batch_op:
+        batch_op.alter_column('pokemon_name', existing_type=sa.VARCHAR(), nullable=False)
+        batch_op.drop_constraint('fk_team_pokemon_species_id_species', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_team_pokemon_species_id'))
+        batch_op.drop_column('species_id')
+
+    with op.batch_alter_table('move_usage', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('move_name', sa.VARCHAR(), nullable=True))
+    op.execute("UPDATE move_usage SET move_name = (SELECT name FROM move WHERE move.id = move_usage.move_id)")
+    with op.batch_alter_table('move_usage', schema=None) as batch_op:
+        batch_op.alter_column('move_name', existing_type=sa.VARCHAR(), nullable=False)
+        batch_op.drop_constraint('fk_move_usage_move_id_move', type_='foreignkey')
+        batch_op.drop_column('move_id')
+
+    op.drop_table('species')
+    op.drop_table('move')
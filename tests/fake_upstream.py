@@ -0,0 +1,52 @@
+"""
+A local stand-in for Showdown and pokeapi, so outbound HTTP can be tested offline.
+
+Usage Example:
+
+    with FakeUpstream() as upstream:
+        upstream.routes["/gen9ou-1.log"] = (200, b"|win|Ash\n")
+        upstream.routes["/slow"] = (200, b"", 5)  # status, body, seconds to wait first
+        requests.get(upstream.url("/gen9ou-1.log"))
+        upstream.hits["/gen9ou-1.log"]  # 1
+
+Paths without a route get a 404.
+"""
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeUpstream:
+    def __init__(self):
+        self.routes = {}
+        self.hits = Counter()
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                upstream.hits[self.path] += 1
+                status, body, *delay = upstream.routes.get(self.path, (404, b"Not found"))
+                if delay:
+                    time.sleep(delay[0])
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path=""):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,8 +1,36 @@
+import contextlib
+import io
+import os
+import tarfile
+import tempfile
+import time
 import unittest
+from datetime import datetime
+from unittest import mock
+import requests
 from flask import url_for
+from sqlalchemy import event, select
 from app import create_app, db
 from config import TestConfig
-from app.models import User, Match, Team, TeamPokemon, MoveUsage, SharedAccess  
+from app.models import User, Match, Team, TeamPokemon, MoveUsage, SharedAccess, PokemonStats, PokemonMoveStats, Species, Move
+from app.pokemon_stats import rebuild_pokemon_stats
+from app.reparse import reparse_matches
+from app.parallel import save_batch
+from app.match_analytics import match_history_cache
+from app.response_cache import ResponseCache, data_version
+from app.state_store import StateStore
+from app.ingest_jobs import ingest_queue
+from app.replay_events import event_types, MoveEvent, TurnEvent
+from app.replay_parser import (ReplayLogParser, ReplayConsumer, PARSER_VERSION, save_parsed_log_to_db, save_parsed_logs_to_db, 
+                               fetch_usr_match_page, fetch_pokemon_data_for_usr,
+                               parse_replays_concurrently)
+from app.sprite_cache import sprite_cache, sprite_key, SPRITE_BASE_URL
+from app.replay_cache import ReplayLogCache, replay_cache, canonical_replay_id
+from app.http_client import HttpClient, CircuitOpenError, http_client
+from tests.fake_upstream import FakeUpstream
+import batch_parse
+
+TEST_LOG = os.path.join(os.path.dirname(__file__), "test_replay.log")
 
 class UserModelCase(unittest.TestCase):
     def setUp(self):
@@ -106,5 +134,703 @@ class RoutesTestCase(unittest.TestCase):
             }, follow_redirects=True)
             self.assertEqual(response.status_code, 200)
 
+    def test_upload_already_processed_replay(self):
+        with self.app.test_request_context():
+            u = User(username="leon", email="leon@email.com")
+            u.set_password("charizard")
+            db.session.add(u)
+            db.session.add(Match(user_id="leon", winner="leon", enemyname="hop", replay_url="https://replay.pokemonshowdown.com/gen9ou-1",
+                                 replay_id="gen9ou-1", teams=[Team(is_user_team=True), Team(is_user_team=False)]))
+            db.session.commit()
+            self.client.post(url_for('main.login'), data={'username': 'leon', 'password': 'charizard'})
+
+            response = self.client.post(url_for('main.upload'), data={
+                'username': 'leon',
+                'replay_0': 'https://replay.pokemonshowdown.com/gen9ou-1',
+                'replay_1': 'https://replay.pokemonshowdown.com/gen9ou-1.log?p2',
+            }, follow_redirects=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"has already been processed", response.data)
+            self.assertEqual(Match.query.count(), 1)
+
+            # the match list and uploaded replays are kept server-side, not in the cookie
+            with self.client.session_transaction() as sess:
+                self.assertIn("state_id", sess)
+                self.assertNotIn("replays", sess)
+                self.assertNotIn("parsed_logs", sess)
+
+class ReplayParserCase(unittest.TestCase):
+    def assertSameReplay(self, a, b):
+        self.assertEqual(a.winner, b.winner)
+        for p in ("p1", "p2"):
+            self.assertEqual(a.players[p], b.players[p])
+
+    def test_parse_from_file(self):
+        replay = ReplayLogParser.from_file(TEST_LOG)
+        self.assertEqual(replay.replay_url, "https://replay.pokemonshowdown.com/test_replay")
+        self.assertEqual(replay.winner, "Ash")
+        self.assertEqual(replay.players['p1'].name, "Ash")
+        self.assertEqual(replay.players['p2'].elo, ["1480", "1460"])
+        self.assertEqual(replay.players['p1'].picks, {"Calyrex", "Fishy", "Incineroar"})
+        calyrex = replay.players['p1'].team["Calyrex"]
+        self.assertEqual(calyrex.name, "Calyrex-Shadow")
+        self.assertEqual(calyrex.moves, {"Astral Barrage": 3})
+        self.assertEqual(calyrex.wins, 3)
+        self.assertTrue(replay.players['p2'].team["Miraidon"].defeated)
+
+    def test_parse_from_bytes_and_lines(self):
+        with open(TEST_LOG, "rb") as f:
+            data = f.read()
+        from_file = ReplayLogParser.from_file(TEST_LOG)
+        self.assertSameReplay(ReplayLogParser.from_bytes(data), from_file)
+        self.assertSameReplay(ReplayLogParser.from_lines(data.decode("utf-8").splitlines()), from_file)
+
+    def test_truncated_log(self):
+        with open(TEST_LOG, "rb") as f:
+            data = f.read()
+        with self.assertRaises(Exception):
+            ReplayLogParser.from_bytes(data[:data.index(b"|win|")])
+
+    def test_names_are_shared_between_replays(self):
+        a, b = ReplayLogParser.from_file(TEST_LOG), ReplayLogParser.from_file(TEST_LOG)
+        calyrex_a, calyrex_b = a.players['p1'].team["Calyrex"], b.players['p1'].team["Calyrex"]
+        self.assertIs(calyrex_a.name, calyrex_b.name)
+        self.assertIs(next(iter(calyrex_a.moves)), next(iter(calyrex_b.moves)))
+        self.assertFalse(hasattr(calyrex_a, "__dict__"))
+
+    def test_incremental_feed(self):
+        with open(TEST_LOG, "rb") as f:
+            data = f.read()
+        for chunk_size in (1, 7, 4096):
+            replay = ReplayLogParser.incremental()
+            for i in range(0, len(data), chunk_size):
+                replay.feed(data[i:i + chunk_size])
+                if i + chunk_size < data.index(b"|win|"):
+                    self.assertIsNone(replay.winner)
+            self.assertSameReplay(replay.close(), ReplayLogParser.from_file(TEST_LOG))
+
+        replay = ReplayLogParser.incremental()
+        replay.feed(data[:data.index(b"|win|")])
+        self.assertRaises(Exception, replay.close)
+
+    def test_event_stream_consumers(self):
+        class TurnCounter(ReplayConsumer):
+            turns = 0
+            def on_turn(self, event):
+                self.turns = event.number
+                # the built-in consumers have already filled in the teams
+                assert self.parser.players['p1'].team
+
+        class FirstMove(ReplayConsumer):
+            def __init__(self):
+                self.moves = []
+            def on_move(self, event):
+                self.moves.append(event.move)
+                self.unsubscribe("move")
+
+        turns, first_move = TurnCounter(), FirstMove()
+        replay = ReplayLogParser.from_file(TEST_LOG, consumers=[turns, first_move])
+        self.assertEqual(turns.turns, 3)
+        self.assertEqual(first_move.moves, ["Astral Barrage"])
+        # the built-in consumers still see every move
+        self.assertSameReplay(replay, ReplayLogParser.from_file(TEST_LOG))
+
+        class EventRecorder(ReplayConsumer):
+            def __init__(self):
+                self.events = []
+            def on_turn(self, event):
+                self.events.append(event)
+            def on_move(self, event):
+                self.events.append(event)
+
+        recorder = EventRecorder()
+        ReplayLogParser.from_file(TEST_LOG, consumers=[recorder])
+        self.assertEqual({type(e) for e in recorder.events}, {TurnEvent, MoveEvent})
+        self.assertIn(MoveEvent("p1", "Calyrex", "Astral Barrage", "p2a: Miraidon"), recorder.events)
+        self.assertEqual(set(event_types(["turn", "move"]).by_name), {"turn", "move"})
+
+    def test_form_without_nickname(self):
+        replay = ReplayLogParser.from_lines([
+            "|player|p1|Ash", "|player|p2|Gary", "|poke|p1|Urshifu-*, L50", "|poke|p2|Miraidon, L50", "|start",
+            "|switch|p1a: Urshifu-Rapid-Strike|Urshifu-Rapid-Strike, L50|100/100",
+            "|switch|p2a: Miraidon|Miraidon, L50|100/100",
+            "|move|p1a: Urshifu-Rapid-Strike|Surging Strikes|p2a: Miraidon",
+            "|faint|p2a: Miraidon", "|win|Ash",
+        ])
+        urshifu = replay.players['p1'].team["Urshifu-Rapid-Strike"]
+        self.assertEqual((urshifu.name, urshifu.moves, urshifu.wins), ("Urshifu-*", {"Surging Strikes": 1}, 1))
+
+class ReplayStorageCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        u = User(username="ash", email="ash@email.com")
+        u.set_password("pikachu")
+        db.session.add(u)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def stats_of(self, species, move=None):
+        """Returns ash's `PokemonStats` of `species`, or their `PokemonMoveStats` of its `move`."""
+        species_id = db.session.scalar(select(Species.id).where(Species.name == species))
+        if move is None:
+            return db.session.get(PokemonStats, ("ash", species_id))
+        move_id = db.session.scalar(select(Move.id).where(Move.name == move))
+        return db.session.get(PokemonMoveStats, ("ash", species_id, move_id))
+
+    def test_save_parsed_log(self):
+        match = save_parsed_log_to_db(ReplayLogParser.from_file(TEST_LOG), db, "ash")
+        self.assertEqual(match.winner, "Ash")
+        self.assertEqual(match.enemyname, "Gary")
+        self.assertEqual((match.p1_initial_elo, match.p1_final_elo), (1500, 1520))
+        usr_team, enemy_team = match.teams
+        self.assertTrue(usr_team.is_user_team)
+        self.assertFalse(enemy_team.is_user_team)
+        calyrex = [p for p in usr_team.pokemons if p.nickname == "Calyrex"][0]
+        self.assertTrue(calyrex.ispick)
+        self.assertEqual([(m.move_name, m.times_used) for m in calyrex.move_usages], [("Astral Barrage", 3)])
+        self.assertEqual(TeamPokemon.query.count(), 8)
+        self.assertEqual(match.replay_id, "test_replay")
+
+    def test_names_stored_once(self):
+        logs = [ReplayLogParser.from_file(TEST_LOG, f"https://replay.pokemonshowdown.com/gen9ou-{i}") for i in range(2)]
+        save_parsed_logs_to_db(logs[:1], db, "ash")
+        save_parsed_log_to_db(logs[1], db, "ash")
+        self.assertEqual(Species.query.count(), 8)
+        self.assertEqual(Move.query.count(), MoveUsage.query.count() // 2)
+        self.assertEqual(Species.lookup(db.session, ["Miraidon"])["Miraidon"].id,
+                         db.session.scalar(select(Species.id).where(Species.name == "Miraidon")))
+        # nicknames are only stored when they differ from the species
+        miraidon = TeamPokemon.query.filter_by(species=Species.lookup(db.session, ["Miraidon"])["Miraidon"]).first()
+        self.assertIsNone(miraidon.nickname)
+        self.assertEqual(TeamPokemon.query.filter_by(nickname="Calyrex").first().pokemon_name, "Calyrex-Shadow")
+
+    def test_save_parsed_logs_in_one_batch(self):
+        logs = [ReplayLogParser.from_file(TEST_LOG, f"https://replay.pokemonshowdown.com/gen9ou-{i}") for i in range(3)]
+        save_parsed_logs_to_db(logs, db, "ash")
+        self.assertEqual(Match.query.count(), 3)
+        self.assertEqual(MoveUsage.query.count(), 12)
+
+    def count_queries(self, func, *args):
+        statements = []
+        def record(conn, cursor, statement, *_):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            result = func(*args)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        return result, len(statements)
+
+    @mock.patch.object(sprite_cache, "get_sprite_url", lambda name: f"/sprites/{name}.png")
+    def test_fetch_matches_query_count(self):
+        save_parsed_log_to_db(ReplayLogParser.from_file(TEST_LOG, "https://replay.pokemonshowdown.com/gen9ou-0"), db, "ash")
+        _, queries_for_one = self.count_queries(fetch_usr_match_page, "ash")
+
+        logs = [ReplayLogParser.from_file(TEST_LOG, f"https://replay.pokemonshowdown.com/gen9ou-{i}") for i in range(1, 30)]
+        save_parsed_logs_to_db(logs, db, "ash")
+        db.session.expire_all()
+        (matches, _), queries_for_many = self.count_queries(fetch_usr_match_page, "ash")
+
+        self.assertEqual(queries_for_one, queries_for_many)
+        self.assertLessEqual(queries_for_many, 5)
+        self.assertEqual([m["match_num"] for m in matches], list(range(30, 0, -1)))
+        self.assertEqual(matches[0]["enemy_picks"][0], ("/sprites/Miraidon.png", "Miraidon"))
+        self.assertEqual([p[1] for p in matches[0]["usr_picks"]], ["Incineroar", "Calyrex", "Fishy"])
+
+    def test_sprites_resolved_at_ingest(self):
+        with mock.patch.object(sprite_cache, "get_sprite_url", lambda name: f"/sprites/{name}.png"):
+            match = save_parsed_log_to_db(ReplayLogParser.from_file(TEST_LOG), db, "ash")
+        self.assertEqual({p.sprite_url for p in match.teams[1].pokemons if p.pokemon_name == "Miraidon"}, {"/sprites/Miraidon.png"})
+
+        # listing matches doesn't look sprites up, except for rows saved before they were stored
+        match.teams[1].pokemons[0].sprite_url = None
+        db.session.commit()
+        with mock.patch.object(sprite_cache, "get_sprite_url", return_value="/sprites/old.png") as lookup:
+            oppteam = fetch_usr_match_page("ash")[0][0]["oppteam"]
+        self.assertEqual({call.args for call in lookup.call_args_list}, {(match.teams[1].pokemons[0].pokemon_name,)})
+        self.assertEqual([sprite for sprite, _ in oppteam][:2], ["/sprites/old.png", "/sprites/Whimsicott.png"])
+
+    @mock.patch.object(sprite_cache, "get_sprite_url", lambda name: f"/sprites/{name}.png")
+    def test_fetch_match_pages(self):
+        logs = [ReplayLogParser.from_file(TEST_LOG, f"https://replay.pokemonshowdown.com/gen9ou-{i}") for i in range(30)]
+        save_parsed_logs_to_db(logs, db, "ash")
+        db.session.expire_all()
+
+        pages, cursor = [], None
+        while True:
+            (page, cursor), queries = self.count_queries(fetch_usr_match_page, "ash", cursor, 12)
+            pages.append([m["match_num"] for m in page])
+            self.assertLessEqual(queries, 5)
+            if cursor is None: break
+        self.assertEqual(pages, [list(range(30, 18, -1)), list(range(18, 6, -1)), list(range(6, 0, -1))])
+        self.assertEqual(fetch_usr_match_page("ash", None, 30)[1], None)
+        self.assertRaises(ValueError, fetch_usr_match_page, "ash", "nonsense")
+
+    def test_fetch_pokemon_data(self):
+        logs = [ReplayLogParser.from_file(TEST_LOG, f"https://replay.pokemonshowdown.com/gen9ou-{i}") for i in range(2)]
+        logs[1].winner = "Gary"
+        first, _ = save_parsed_logs_to_db(logs, db, "ash")
+
+        poke_dict = fetch_pokemon_data_for_usr("ash", first.id)
+        self.assertEqual(set(poke_dict), {"Calyrex-Shadow", "Urshifu-*", "Incineroar", "Rillaboom"})
+        self.assertEqual(poke_dict["Calyrex-Shadow"], {
+            "moves": {"Astral Barrage": 6}, "wins": 6, "losses": 0, "matches_won": 1, "truename": "Calyrex-Shadow"
+        })
+        self.assertEqual(poke_dict["Urshifu-*"]["losses"], 2)
+        self.assertEqual(poke_dict["Rillaboom"]["moves"], {})
+
+    def test_filtered_pokemon_data(self):
+        urls = [f"https://replay.pokemonshowdown.com/{fmt}-{i}" for i, fmt in enumerate(["gen9ou", "gen9ou", "gen9vgc2025regg"])]
+        logs = [ReplayLogParser.from_file(TEST_LOG, url) for url in urls]
+        logs[1].players["p2"].name = logs[1].winner = "Misty"
+        logs[2].started_at += 30 * 24 * 60 * 60
+        first, _, _ = save_parsed_logs_to_db(logs, db, "ash")
+        self.assertEqual(first.played_at, datetime(2025, 4, 18, 18, 13, 20))
+
+        # unfiltered, the columnar history agrees with the running totals
+        history = match_history_cache.get("ash")
+        self.assertEqual(history.pokemon_stats(species=["Calyrex-Shadow", "Incineroar"]), {
+            name: stats for name, stats in fetch_pokemon_data_for_usr("ash", first.id).items() if name in ("Calyrex-Shadow", "Incineroar")
+        })
+        self.assertEqual(history.pokemon_stats()["Calyrex-Shadow"]["moves"], {"Astral Barrage": 9})
+
+        def calyrex(**filters):
+            stats = fetch_pokemon_data_for_usr("ash", first.id, filters)
+            return stats.get("Calyrex-Shadow", {}).get("wins"), stats.get("Calyrex-Shadow", {}).get("matches_won")
+        self.assertEqual(calyrex(format="gen9vgc2025regg"), (3, 1))
+        self.assertEqual(calyrex(opponent="misty"), (3, 0))
+        self.assertEqual(calyrex(opponent=["GARY", "misty"]), (9, 2))
+        self.assertEqual(calyrex(since=datetime(2025, 5, 1)), (3, 1))
+        self.assertEqual(calyrex(until=datetime(2025, 5, 1), format=["gen9ou"]), (6, 1))
+        self.assertEqual(calyrex(opponent="brock"), (None, None))
+        # the loaded history is reused until the user's matches change
+        self.assertIs(match_history_cache.get("ash"), history)
+        db.session.delete(first)
+        db.session.commit()
+        self.assertEqual(match_history_cache.get("ash").pokemon_stats()["Calyrex-Shadow"]["wins"], 6)
+
+    def test_pokemon_stats_follow_deleted_matches(self):
+        logs = [ReplayLogParser.from_file(TEST_LOG, f"https://replay.pokemonshowdown.com/gen9ou-{i}") for i in range(2)]
+        first, second = save_parsed_logs_to_db(logs, db, "ash")
+        self.assertEqual(self.stats_of("Calyrex-Shadow").wins, 6)
+        self.assertEqual(self.stats_of("Calyrex-Shadow", "Astral Barrage").times_used, 6)
+
+        db.session.delete(first)
+        db.session.commit()
+        self.assertEqual(self.stats_of("Calyrex-Shadow").wins, 3)
+        self.assertEqual(rebuild_pokemon_stats(db.session), 0)
+        self.assertEqual(db.session.get(User, "ash").match_count, 1)
+
+        db.session.get(User, "ash").matches.remove(second)
+        db.session.commit()
+        self.assertEqual(db.session.get(User, "ash").match_count, 0)
+        self.assertEqual(PokemonStats.query.count(), 0)
+        self.assertEqual(PokemonMoveStats.query.count(), 0)
+
+    def test_rebuild_pokemon_stats(self):
+        save_parsed_log_to_db(ReplayLogParser.from_file(TEST_LOG), db, "ash")
+        self.stats_of("Incineroar").wins = 100
+        db.session.get(User, "ash").match_count = 5
+        db.session.delete(self.stats_of("Calyrex-Shadow", "Astral Barrage"))
+        db.session.commit()
+
+        self.assertEqual(rebuild_pokemon_stats(db.session), 3)
+        db.session.commit()
+        self.assertEqual(db.session.get(User, "ash").match_count, 1)
+        self.assertEqual(self.stats_of("Incineroar").wins, 1)
+        self.assertEqual(self.stats_of("Calyrex-Shadow", "Astral Barrage").times_used, 3)
+
+        db.session.delete(db.session.get(User, "ash"))
+        db.session.commit()
+        self.assertEqual(PokemonStats.query.count(), 0)
+
+    def test_reparse_outdated_matches(self):
+        urls = [f"https://replay.pokemonshowdown.com/gen9ou-{i}" for i in range(2)]
+        matches = save_parsed_logs_to_db([ReplayLogParser.from_file(TEST_LOG, url) for url in urls], db, "ash")
+        self.assertEqual({m.parser_version for m in matches}, {PARSER_VERSION})
+        # as stored by an older parser, with only the first replay's log kept locally
+        for match in matches:
+            match.parser_version = None
+        calyrex = [p for p in matches[0].teams[0].pokemons if p.nickname == "Calyrex"][0]
+        calyrex.wins = 0
+        calyrex.move_usages.clear()
+        db.session.commit()
+        rebuild_pokemon_stats(db.session)
+        db.session.commit()
+        version = data_version("ash")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ReplayLogCache(tmpdir, max_bytes=1024 * 1024)
+            with open(TEST_LOG, "rb") as f:
+                cache.put("gen9ou-0", f.read())
+            with mock.patch("app.reparse.replay_cache", cache):
+                result = reparse_matches(db.session, workers=1, download=False)
+                self.assertEqual((result.reparsed, result.missing, result.failures), (1, 1, []))
+                self.assertEqual(reparse_matches(db.session, workers=1, download=False).reparsed, 0)
+
+        match = db.session.get(Match, matches[0].id)
+        self.assertEqual(match.parser_version, PARSER_VERSION)
+        calyrex = [p for p in match.teams[0].pokemons if p.nickname == "Calyrex"][0]
+        self.assertEqual((calyrex.wins, [(m.move_name, m.times_used) for m in calyrex.move_usages]), (3, [("Astral Barrage", 3)]))
+        self.assertEqual(TeamPokemon.query.count(), 16)
+        self.assertIsNone(db.session.get(Match, matches[1].id).parser_version)
+        # the totals moved with the rewritten rows, and cached views were expired
+        self.assertEqual(rebuild_pokemon_stats(db.session), 0)
+        self.assertGreater(data_version("ash"), version)
+
+    def test_data_version_bumped_on_change(self):
+        self.assertEqual(data_version("ash"), 0)
+        match = save_parsed_log_to_db(ReplayLogParser.from_file(TEST_LOG), db, "ash")
+        self.assertEqual(data_version("ash"), 1)
+        db.session.delete(match)
+        db.session.commit()
+        self.assertEqual(data_version("ash"), 2)
+
+class BatchParseCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        tmpdir = self.tmpdir.name
+        class BatchConfig(TestConfig):
+            # `batch_parse.main` creates its own app, which needs to see the same database
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmpdir, 'app.db')}"
+        self.config = BatchConfig
+        self.app = create_app(BatchConfig)
+        with self.app.app_context():
+            db.create_all()
+            u = User(username="ash", email="ash@email.com")
+            u.set_password("pikachu")
+            db.session.add(u)
+            db.session.commit()
+
+        with open(TEST_LOG, "rb") as f:
+            log = f.read()
+        self.tarball = os.path.join(tmpdir, "logs.tar.gz")
+        with tarfile.open(self.tarball, "w:gz") as tar:
+            for name, data in [("gen9ou-1.log", log), ("gen9ou-2.log", log), ("gen9ou-3.log", log[:log.index(b"|win|")])]:
+                member = tarfile.TarInfo(name)
+                member.size = len(data)
+                tar.addfile(member, io.BytesIO(data))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+        self.tmpdir.cleanup()
+
+    def run_batch_parse(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = batch_parse.main([self.tarball, "ash", "--workers", "1"], config_class=self.config)
+        return status, output.getvalue()
+
+    def test_batch_parse_tarball(self):
+        status, output = self.run_batch_parse()
+        self.assertEqual(status, 1)
+        self.assertIn("2 saved, 0 already stored, 1 failed", output)
+        self.assertIn("FAILED gen9ou-3.log", output)
+
+        # a second run skips the replays it already saved
+        status, output = self.run_batch_parse()
+        self.assertIn("0 saved, 2 already stored, 1 failed", output)
+        with self.app.app_context():
+            self.assertEqual(sorted(db.session.scalars(select(Match.replay_id))), ["gen9ou-1", "gen9ou-2"])
+            self.assertEqual(rebuild_pokemon_stats(db.session), 0)
+
+    def test_save_batch_retries_each_item(self):
+        saved, rollbacks = [], []
+        def save(pairs):
+            if any(item == "bad" for _, item in pairs):
+                raise ValueError("bad item")
+            saved.extend(name for name, _ in pairs)
+        failures = save_batch(save, [("a", "ok"), ("b", "bad"), ("c", "ok")], lambda: rollbacks.append(1))
+        self.assertEqual(saved, ["a", "c"])
+        self.assertEqual(failures, [("b", "ValueError: bad item")])
+        self.assertEqual(len(rollbacks), 2)
+
+class ResponseCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2)
+        calls = []
+        compute = lambda key: (lambda: calls.append(key) or {"key": key})
+        cache.get_or_compute(["ash", 0, 1], compute(1))
+        cache.get_or_compute(["ash", 0, 2], compute(2))
+        cache.get_or_compute(["ash", 0, 1], compute(1))
+        cache.get_or_compute(["ash", 0, 3], compute(3))
+        cache.get_or_compute(["ash", 0, 1], compute(1))
+        cache.get_or_compute(["ash", 0, 2], compute(2))
+        self.assertEqual(calls, [1, 2, 3, 2])
+
+    def test_shared_disk_backend(self):
+        path = os.path.join(self.tmpdir.name, "cache.db")
+        ResponseCache(path=path).get_or_compute(["ash", 0, "matches"], lambda: [{"id": 1}])
+        other_process = ResponseCache(path=path)
+        self.assertEqual(other_process.get_or_compute(["ash", 0, "matches"], lambda: self.fail("not shared")), [{"id": 1}])
+
+class StateStoreCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_set_and_delete(self):
+        store = StateStore(path=os.path.join(self.tmpdir.name, "state.db"))
+        store.set("abc", "replays", ["https://replay.pokemonshowdown.com/gen9ou-1"])
+        store.set("abc", "vis_username", "ash")
+        self.assertEqual(StateStore(path=store.path).get("abc", "replays"), ["https://replay.pokemonshowdown.com/gen9ou-1"])
+        self.assertIsNone(store.get("xyz", "replays"))
+        store.delete("abc", "replays")
+        self.assertEqual(store.get("abc", "replays", []), [])
+        store.delete("abc")
+        self.assertIsNone(store.get("abc", "vis_username"))
+
+    def test_entries_expire(self):
+        for path in (None, os.path.join(self.tmpdir.name, "state.db")):
+            store = StateStore(path=path, ttl=-1)
+            store.set("abc", "vis_username", "ash")
+            self.assertIsNone(store.get("abc", "vis_username"))
+
+class SpriteCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        class SpriteConfig(TestConfig):
+            SPRITE_CACHE_PATH = os.path.join(self.tmpdir.name, "sprites.db")
+        self.app = create_app(SpriteConfig)
+
+    def tearDown(self):
+        create_app(TestConfig)  # back to the in-memory cache
+        self.tmpdir.cleanup()
+
+    def test_persistent_cache(self):
+        with mock.patch.object(sprite_cache, "_fetch_sprite_url", return_value="/sprites/calyrex-shadow.png") as fetch:
+            self.assertEqual(sprite_cache.get_sprite_url("Calyrex-Shadow"), "/sprites/calyrex-shadow.png")
+            self.assertEqual(sprite_cache.get_sprite_url("Calyrex-Shadow"), "/sprites/calyrex-shadow.png")
+            # a restarted or different worker process finds it on disk
+            sprite_cache.init_app(self.app)
+            self.assertEqual(sprite_cache.get_sprite_url("Calyrex-Shadow"), "/sprites/calyrex-shadow.png")
+            self.assertEqual(fetch.call_count, 1)
+
+            # expired entries are looked up again, keeping the old answer if that fails
+            sprite_cache.ttl = -1
+            fetch.return_value = None
+            self.assertEqual(sprite_cache.get_sprite_url("Calyrex-Shadow"), "/sprites/calyrex-shadow.png")
+            self.assertEqual(fetch.call_count, 2)
+
+    def test_manifest_lookup(self):
+        self.assertEqual(sprite_key("Nidoran♀"), "nidoranf")
+        self.assertEqual(sprite_key("Farfetch’d"), "farfetchd")
+        self.assertEqual(sprite_key("Urshifu-*"), "urshifu")
+        self.assertEqual(sprite_key("Flabébé"), "flabebe")
+        with mock.patch.object(sprite_cache, "_fetch_sprite_url", side_effect=AssertionError("no network I/O")):
+            self.assertEqual(sprite_cache.get_sprite_url("Urshifu-*"), f"{SPRITE_BASE_URL}892.png")
+            self.assertEqual(sprite_cache.get_sprite_url("Nidoran-M"), f"{SPRITE_BASE_URL}32.png")
+            self.assertEqual(sprite_cache.get_sprite_url("Mr. Mime"), f"{SPRITE_BASE_URL}122.png")
+            self.assertEqual(sprite_cache.get_sprite_url("Flabébé"), f"{SPRITE_BASE_URL}669.png")
+
+class HttpClientCase(unittest.TestCase):
+    def setUp(self):
+        self.upstream = FakeUpstream().__enter__()
+        with open(TEST_LOG, "rb") as f:
+            self.upstream.routes["/gen9ou-1.log"] = (200, f.read())
+        self.upstream.routes["/down"] = (503, b"")
+        self.upstream.routes["/slow"] = (200, b"", 1)
+
+    def tearDown(self):
+        self.upstream.__exit__(None, None, None)
+
+    def test_timeouts_and_retries(self):
+        client = HttpClient(read_timeout=0.1, retries=2, backoff=0)
+        start = time.perf_counter()
+        self.assertRaises(requests.exceptions.RequestException, client.get, self.upstream.url("/slow"))
+        self.assertLess(time.perf_counter() - start, 0.9)
+        self.assertEqual(client.get(self.upstream.url("/down")).status_code, 503)
+        self.assertEqual(self.upstream.hits["/down"], 3)
+
+    def test_failures_are_remembered(self):
+        client = HttpClient(retries=0, failure_ttl=60)
+        for _ in range(3):
+            self.assertEqual(client.get(self.upstream.url("/missing")).status_code, 404)
+        self.assertEqual(self.upstream.hits["/missing"], 1)
+
+    def test_remembered_failures_are_bounded(self):
+        client = HttpClient(read_timeout=0.1, retries=0, failure_ttl=60, max_failures=2)
+        errors = []
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.RequestException) as raised:
+                client.get(self.upstream.url("/slow"))
+            errors.append(raised.exception)
+        # the remembered failure is raised again as a new exception of the same type
+        self.assertIsNot(errors[0], errors[1])
+        self.assertIs(type(errors[0]), type(errors[1]))
+        self.assertEqual(self.upstream.hits["/slow"], 1)
+
+        for i in range(3):
+            client.get(self.upstream.url(f"/missing-{i}"))
+        self.assertEqual(list(client._failures), [self.upstream.url("/missing-1"), self.upstream.url("/missing-2")])
+
+        client = HttpClient(retries=0, failure_ttl=0.1)
+        client.get(self.upstream.url("/missing-0"))
+        time.sleep(0.1)
+        client.get(self.upstream.url("/missing-1"))
+        # expired failures are dropped without being asked for again
+        self.assertEqual(list(client._failures), [self.upstream.url("/missing-1")])
+
+    def test_circuit_breaker(self):
+        client = HttpClient(retries=0, failure_ttl=0, breaker_threshold=2, breaker_cooldown=0.2)
+        client.get(self.upstream.url("/down"))
+        client.get(self.upstream.url("/down"))
+        self.assertRaises(CircuitOpenError, client.get, self.upstream.url("/gen9ou-1.log"))
+        self.assertEqual(self.upstream.hits["/gen9ou-1.log"], 0)
+
+        time.sleep(0.2)
+        self.assertEqual(client.get(self.upstream.url("/gen9ou-1.log")).status_code, 200)
+        self.assertEqual(client.get(self.upstream.url("/gen9ou-1.log")).status_code, 200)
+
+    def test_fetch_replay(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ReplayLogCache(tmpdir, max_bytes=1024 * 1024)
+            for _ in range(2):
+                replay = ReplayLogParser(self.upstream.url("/gen9ou-1"), session=HttpClient(), cache=cache)
+                self.assertEqual(replay.winner, "Ash")
+            # the streamed download was cached whole
+            self.assertEqual(self.upstream.hits["/gen9ou-1.log"], 1)
+            self.assertEqual(cache.get("gen9ou-1"), self.upstream.routes["/gen9ou-1.log"][1])
+
+    def test_parse_replays_concurrently(self):
+        log = self.upstream.routes["/gen9ou-1.log"][1]
+        # the first replay is the slowest to download, but still comes back first
+        self.upstream.routes["/gen9ou-1.log"] = (200, log, 0.3)
+        self.upstream.routes["/gen9ou-3.log"] = (200, log)
+        urls = [self.upstream.url(f"/gen9ou-{i}") for i in range(1, 4)]
+        results = list(parse_replays_concurrently(urls, max_workers=3, session=HttpClient(retries=0)))
+
+        self.assertEqual([url for url, _, _ in results], urls)
+        (_, first, first_error), (_, missing, error), (_, third, third_error) = results
+        self.assertEqual((first.winner, third.winner), ("Ash", "Ash"))
+        self.assertIsNone(first_error)
+        self.assertIsNone(third_error)
+        # the missing replay fails on its own, without taking the others with it
+        self.assertIsNone(missing)
+        self.assertIsInstance(error, requests.exceptions.HTTPError)
+
+    def test_sprite_lookup_failure_is_not_cached(self):
+        with mock.patch.object(http_client, "get", side_effect=requests.exceptions.ConnectionError("down")):
+            self.assertEqual(sprite_cache.get_sprite_url("Calyrex-Shadow"), sprite_cache._default_sprite)
+        response = mock.Mock(status_code=200, json=lambda: {"sprites": {"front_default": "/sprites/calyrex-shadow.png"}})
+        with mock.patch.object(http_client, "get", return_value=response):
+            self.assertEqual(sprite_cache.get_sprite_url("Calyrex-Shadow"), "/sprites/calyrex-shadow.png")
+
+class IngestJobCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        tmpdir = self.tmpdir.name
+        class IngestConfig(TestConfig):
+            # the worker thread and the test need to see the same database
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmpdir, 'app.db')}"
+            STATE_STORE_PATH = os.path.join(tmpdir, "state.db")
+            INGEST_WORKERS = 1
+        self.app = create_app(IngestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        u = User(username="ash", email="ash@email.com")
+        u.set_password("pikachu")
+        db.session.add(u)
+        db.session.commit()
+
+        self.upstream = FakeUpstream().__enter__()
+        with open(TEST_LOG, "rb") as f:
+            self.upstream.routes["/gen9ou-1.log"] = (200, f.read(), 0.2)
+
+    def tearDown(self):
+        self.upstream.__exit__(None, None, None)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.tmpdir.cleanup()
+
+    def test_poll_job_run_by_worker_thread(self):
+        with self.app.test_request_context():
+            self.client.post(url_for('main.login'), data={'username': 'ash', 'password': 'pikachu'})
+            urls = [self.upstream.url("/gen9ou-1"), self.upstream.url("/gen9ou-2")]
+            job = ingest_queue.submit("ash", urls)
+            # progress is kept in the shared state store, so any process can report it
+            self.assertEqual(StateStore(self.app.config["STATE_STORE_PATH"]).get(f"ingest-job:{job.id}", "job")["username"], "ash")
+
+            deadline = time.monotonic() + 10
+            while True:
+                response = self.client.get(url_for('main.ingest_job_status', job_id=job.id))
+                self.assertEqual(response.status_code, 200)
+                status = response.get_json()
+                if status["status"] == "finished" or time.monotonic() > deadline:
+                    break
+                self.assertIn(status["status"], ("queued", "running"))
+                time.sleep(0.05)
+
+            self.assertEqual(status["status"], "finished")
+            self.assertEqual((status["done"], status["saved"], status["total"]), (2, 1, 2))
+            self.assertEqual([r["status"] for r in status["replays"]], ["saved", "failed"])
+            self.assertEqual(Match.query.count(), 1)
+            self.assertEqual(self.client.get(url_for('main.ingest_job_status', job_id="missing")).status_code, 404)
+
+class ReplayCacheCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_canonical_replay_id(self):
+        for url in ["https://replay.pokemonshowdown.com/gen9ou-123",
+                    "https://replay.pokemonshowdown.com/gen9ou-123/",
+                    "https://replay.pokemonshowdown.com/gen9ou-123.log",
+                    "https://replay.pokemonshowdown.com/gen9ou-123?p2",
+                    "battle-gen9ou-123"]:
+            self.assertEqual(canonical_replay_id(url), "gen9ou-123")
+
+    def test_get_and_put(self):
+        cache = ReplayLogCache(self.tmpdir.name, max_bytes=1024 * 1024)
+        self.assertIsNone(cache.get("gen9ou-123"))
+        cache.put("gen9ou-123", b"|win|Ash\n")
+        self.assertEqual(cache.get("gen9ou-123"), b"|win|Ash\n")
+
+    def test_lru_eviction(self):
+        cache = ReplayLogCache(self.tmpdir.name, max_bytes=3500)
+        for i in range(3):
+            cache.put(f"gen9ou-{i}", os.urandom(1000))
+            # make sure every log has a distinct, increasing modification time
+            os.utime(cache.path_for(f"gen9ou-{i}"), (i, i))
+        # reading the oldest log makes it the most recently used one
+        self.assertIsNotNone(cache.get("gen9ou-0"))
+        cache.put("gen9ou-3", os.urandom(1000))
+        self.assertIsNotNone(cache.get("gen9ou-0"))
+        self.assertIsNone(cache.get("gen9ou-1"))
+        self.assertIsNotNone(cache.get("gen9ou-3"))
+
+    def test_init_app_redirects_global_cache(self):
+        class CacheConfig(TestConfig):
+            REPLAY_CACHE_DIR = self.tmpdir.name
+        create_app(CacheConfig)
+        replay_cache.put("gen9ou-123", b"|win|Ash\n")
+        self.assertTrue(replay_cache.path_for("gen9ou-123").startswith(self.tmpdir.name))
+        self.assertEqual(replay_cache.get("gen9ou-123"), b"|win|Ash\n")
+
+        # the test config caches nothing
+        create_app(TestConfig)
+        self.assertIsNone(replay_cache.get("gen9ou-123"))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file